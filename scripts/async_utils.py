@@ -0,0 +1,143 @@
+"""
+Asyncio variants of the helpers in `utils`.
+
+They run the same commands (including the pooled SSH sessions) as asyncio subprocesses, so independent steps can be
+overlapped with `asyncio.gather` instead of ad-hoc threads. On timeout or cancellation the subprocess is killed and
+reaped before the exception propagates.
+"""
+
+import asyncio
+import os
+import subprocess
+import time
+from typing import Optional
+
+from loguru import logger
+
+from scripts.tracing import traced
+from scripts.utils import (
+    BACKEND,
+    CLUSTER_TOOLS,
+    MUTATING_KUBECTL_COMMANDS,
+    SSH_POOL,
+    TOPOLOGY,
+    build_copy_command,
+    build_ssh_command,
+    env,
+    get_jobs_info,
+    get_node_info,
+    get_pods_info,
+)
+
+
+async def _kill(process: asyncio.subprocess.Process) -> None:
+    if process.returncode is None:
+        process.kill()
+        await process.wait()
+
+
+@traced("command", lambda command, *args, **kwargs: " ".join(command)[:100])
+async def run_command_async(
+    command: list[str],
+    env: dict[str, str] = env,
+    log_success: bool = True,
+    timeout: Optional[float] = None,
+    input: Optional[bytes] = None,
+) -> subprocess.CompletedProcess[bytes]:
+    if BACKEND.simulated and command[0] in CLUSTER_TOOLS:
+        return await asyncio.to_thread(BACKEND.run, command, input)
+
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        env=env,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(input), timeout=timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        logger.warning(f"\nCommand timed out or was cancelled: {' '.join(command)}")
+        await _kill(process)
+        raise
+
+    if len(command) > 1 and command[0] == "kubectl" and command[1] in MUTATING_KUBECTL_COMMANDS:
+        TOPOLOGY.invalidate()
+
+    res = subprocess.CompletedProcess(command, process.returncode, stdout, stderr)  # type: ignore
+    if res.returncode != 0:
+        logger.error(f"\nCommand: {' '.join(command)}")
+        print(f"Output: {res.stderr.decode('utf-8')}")
+        print(f"Return code: {res.returncode}")
+        return res
+
+    if log_success:
+        logger.success(f"\nCommand: {' '.join(command)}")
+        print(f"Output: {res.stdout.decode('utf-8')}")
+    return res
+
+
+@traced("ssh", lambda node, command, *args, **kwargs: f"{node}: {command}"[:100])
+async def ssh_command_async(
+    node: str,
+    command: str,
+    env: dict[str, str] = env,
+    timeout: Optional[float] = None,
+    input: Optional[bytes] = None,
+) -> subprocess.CompletedProcess[bytes]:
+    # Opening a pooled master connection blocks, so it happens in a worker thread
+    ssh_command, kind = await asyncio.to_thread(build_ssh_command, node, command, env)
+    logger.info(f"\n(Asyncio) SSH Command on node {node}: {command}")
+
+    start = time.monotonic()
+    res = await run_command_async(ssh_command, env, log_success=False, timeout=timeout, input=input)
+    SSH_POOL.record(node, kind, time.monotonic() - start)
+    return res
+
+
+async def spawn_ssh_async(node: str, command: str, file, env: dict[str, str] = env) -> asyncio.subprocess.Process:
+    """Starts a long-running command on the node whose output goes to `file`, without waiting for it."""
+    ssh_command, _ = await asyncio.to_thread(build_ssh_command, node, command, env)
+    logger.info(f"\n(Asyncio, background) SSH Command on node {node}: {command}")
+    return await asyncio.create_subprocess_exec(*ssh_command, env=env, stdout=file, stderr=subprocess.STDOUT)
+
+
+@traced("copy", lambda node, source_path, *args, **kwargs: f"{source_path} -> {node}")
+async def copy_file_to_node_async(
+    node: str, source_path: str, destination_path: str, timeout: Optional[float] = None
+) -> subprocess.CompletedProcess[bytes]:
+    print(f"Copying file {source_path} to node {node}")
+    copy_command, kind = await asyncio.to_thread(build_copy_command, node, source_path, destination_path, True)
+
+    start = time.monotonic()
+    res = await run_command_async(copy_command, dict(os.environ), timeout=timeout)
+    SSH_POOL.record(node, kind, time.monotonic() - start)
+    return res
+
+
+@traced("copy", lambda node, source_path, *args, **kwargs: f"{node}:{source_path}")
+async def copy_file_from_node_async(
+    node: str, source_path: str, destination_path: str, timeout: Optional[float] = None
+) -> subprocess.CompletedProcess[bytes]:
+    print(f"Copying file {source_path} from node {node}")
+    copy_command, kind = await asyncio.to_thread(build_copy_command, node, source_path, destination_path, False)
+
+    start = time.monotonic()
+    res = await run_command_async(copy_command, dict(os.environ), timeout=timeout)
+    SSH_POOL.record(node, kind, time.monotonic() - start)
+    return res
+
+
+# The queries go through the in-process API client (see kube_client), so they only need to leave the event loop
+
+
+async def get_node_info_async() -> list[list[str]]:
+    return await asyncio.to_thread(get_node_info)
+
+
+async def get_pods_info_async() -> list[list[str]]:
+    return await asyncio.to_thread(get_pods_info)
+
+
+async def get_jobs_info_async() -> list[list[str]]:
+    return await asyncio.to_thread(get_jobs_info)
@@ -0,0 +1,80 @@
+"""
+Execution backends: what the orchestration in `utils`, `job` and the task scripts needs from a cluster.
+
+The `kubernetes` backend is the real cluster (API server for listing and watching, kubectl/kops/gcloud for
+everything else). The `local` backend simulates a cluster on this machine (see `local_cluster`), so that the
+scheduling logic can be run and timed without paying for one. Select it with CCA_BACKEND=local.
+"""
+
+import os
+import subprocess
+from typing import Callable, Optional
+
+from scripts.kube_client import get_client
+from scripts.kube_watch import get_watch, wait_for
+
+
+class ExecutionBackend:
+    name = ""
+    # Whether cluster tools and node commands are handled by the backend instead of being spawned as they are
+    simulated = False
+
+    def list_objects(self, resource_type: str) -> list:
+        """Records (NodeInfo, PodInfo, JobInfo or ServiceInfo) of all objects of `resource_type`."""
+        raise NotImplementedError
+
+    def items(self, resource_type: str) -> list:
+        """Like `list_objects`, but may return the state kept by an ongoing watch instead of asking again."""
+        return self.list_objects(resource_type)
+
+    def wait_for(self, resource_type: str, predicate: Callable[[list], bool], timeout: Optional[float] = None) -> bool:
+        raise NotImplementedError
+
+    def run(self, command: list[str], input: Optional[bytes] = None) -> subprocess.CompletedProcess[bytes]:
+        """Executes a kubectl/kops/gsutil/gcloud command line (only called for simulated backends)."""
+        raise NotImplementedError
+
+    def node_argv(self, node: str, command: str) -> list[str]:
+        """Command line that runs a shell command on the node (only called for simulated backends)."""
+        raise NotImplementedError
+
+    def copy_argv(self, node: str, source_path: str, destination_path: str, to_node: bool) -> list[str]:
+        raise NotImplementedError
+
+
+class KubernetesBackend(ExecutionBackend):
+    name = "kubernetes"
+
+    def list_objects(self, resource_type: str) -> list:
+        client = get_client()
+        list_functions = {
+            "nodes": client.list_nodes,
+            "pods": client.list_pods,
+            "jobs": client.list_jobs,
+            "services": client.list_services,
+        }
+        return list_functions[resource_type]()
+
+    def items(self, resource_type: str) -> list:
+        return get_watch(resource_type).items()
+
+    def wait_for(self, resource_type: str, predicate: Callable[[list], bool], timeout: Optional[float] = None) -> bool:
+        return wait_for(resource_type, predicate, timeout=timeout)
+
+
+_backend: Optional[ExecutionBackend] = None
+
+
+def get_backend() -> ExecutionBackend:
+    global _backend
+    if _backend is None:
+        name = os.environ.get("CCA_BACKEND", "kubernetes")
+        if name == "local":
+            from scripts.local_cluster import LocalBackend
+
+            _backend = LocalBackend.from_env()
+        elif name == "kubernetes":
+            _backend = KubernetesBackend()
+        else:
+            raise ValueError(f"Unknown backend {name}, expected 'kubernetes' or 'local'")
+    return _backend
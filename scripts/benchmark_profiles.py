@@ -0,0 +1,154 @@
+"""
+Measured runtimes of the batch benchmarks, read from the part 2b results (one PARSEC log per benchmark, number of
+threads and repetition). Used wherever a benchmark has to be simulated instead of run.
+"""
+
+import os
+import re
+from typing import Optional
+
+
+TASK2A_RESULTS = os.path.join(".", "results", "task2a")
+TASK2B_RESULTS = os.path.join(".", "results", "task2b")
+
+# results/task2b/parsec-<benchmark>/[<repetition>-]num_threads_<threads>.txt
+RESULT_FILE_PATTERN = re.compile(r"^(?:\d+-)?num_threads_(\d+)\.txt$")
+# results/task2a/<interference>/[<repetition>-]parsec-<benchmark>.txt
+INTERFERENCE_FILE_PATTERN = re.compile(r"^(?:\d+-)?parsec-(\w+)\.txt$")
+
+# Node type -> runtime relative to the machines the part 2b measurements were taken on
+NODE_SPEEDS = {
+    "node-a-2core": 1.0,
+    "node-b-4core": 1.0,
+    # e2-standard-8 has the low performance cores
+    "node-c-8core": 1.3,
+}
+
+# Interference a job causes to the jobs running on other cores of the same node
+COLOCATION_INTERFERENCES = ("ibench-llc", "ibench-membw")
+# Fraction of the slowdown measured against the ibench microbenchmarks that a neighbouring job causes
+COLOCATION_WEIGHT = 0.3
+
+
+def parse_time(time_str: str) -> float:
+    # 2m36.384s -> 156.384
+    minutes, seconds = time_str.strip().rstrip("s").split("m")
+    return float(minutes) * 60 + float(seconds)
+
+
+def read_real_time(path: str) -> Optional[float]:
+    with open(path) as f:
+        for line in f:
+            if line.startswith("real"):
+                return parse_time(line.split("\t")[1])
+    return None
+
+
+def load_runtimes(results_dir: str = TASK2B_RESULTS) -> dict[str, dict[int, float]]:
+    """Returns benchmark -> number of threads -> mean runtime in seconds over all repetitions."""
+    samples: dict[str, dict[int, list[float]]] = {}
+    if not os.path.isdir(results_dir):
+        return {}
+
+    for directory in sorted(os.listdir(results_dir)):
+        if not directory.startswith("parsec-"):
+            continue
+        benchmark = directory.removeprefix("parsec-")
+        for file_name in os.listdir(os.path.join(results_dir, directory)):
+            match = RESULT_FILE_PATTERN.match(file_name)
+            if match is None:
+                continue
+            runtime = read_real_time(os.path.join(results_dir, directory, file_name))
+            if runtime is not None:
+                samples.setdefault(benchmark, {}).setdefault(int(match.group(1)), []).append(runtime)
+
+    return {
+        benchmark: {threads: sum(values) / len(values) for threads, values in sorted(by_threads.items())}
+        for benchmark, by_threads in samples.items()
+    }
+
+
+def load_slowdowns(results_dir: str = TASK2A_RESULTS) -> dict[str, dict[str, float]]:
+    """
+    Returns benchmark -> interference (ibench-cpu, ibench-llc, ...) -> mean runtime with that interference divided by
+    the mean runtime without interference.
+    """
+    samples: dict[str, dict[str, list[float]]] = {}
+    if not os.path.isdir(results_dir):
+        return {}
+
+    for interference in sorted(os.listdir(results_dir)):
+        if not os.path.isdir(os.path.join(results_dir, interference)):
+            continue
+        for file_name in os.listdir(os.path.join(results_dir, interference)):
+            match = INTERFERENCE_FILE_PATTERN.match(file_name)
+            if match is None:
+                continue
+            runtime = read_real_time(os.path.join(results_dir, interference, file_name))
+            if runtime is not None:
+                samples.setdefault(match.group(1), {}).setdefault(interference, []).append(runtime)
+
+    slowdowns: dict[str, dict[str, float]] = {}
+    for benchmark, by_interference in samples.items():
+        baseline = by_interference.get("no_interference")
+        if not baseline:
+            continue
+        baseline_mean = sum(baseline) / len(baseline)
+        slowdowns[benchmark] = {
+            interference: (sum(values) / len(values)) / baseline_mean
+            for interference, values in sorted(by_interference.items())
+            if interference != "no_interference"
+        }
+    return slowdowns
+
+
+_runtimes: Optional[dict[str, dict[int, float]]] = None
+
+
+def runtime(benchmark: str, nr_threads: int) -> Optional[float]:
+    """
+    Runtime of `benchmark` with `nr_threads` threads, linearly interpolated between the measured thread counts and
+    clamped to the measured range. Returns None for unknown benchmarks.
+    """
+    global _runtimes
+    if _runtimes is None:
+        _runtimes = load_runtimes()
+
+    by_threads = _runtimes.get(benchmark)
+    if not by_threads:
+        return None
+    if nr_threads in by_threads:
+        return by_threads[nr_threads]
+
+    measured = sorted(by_threads)
+    lower = max([t for t in measured if t < nr_threads], default=measured[0])
+    upper = min([t for t in measured if t > nr_threads], default=measured[-1])
+    if lower == upper:
+        return by_threads[lower]
+    weight = (nr_threads - lower) / (upper - lower)
+    return by_threads[lower] * (1 - weight) + by_threads[upper] * weight
+
+
+class RuntimeModel:
+    """Predicted runtime of a benchmark on a node type, alone or next to other jobs on the same node."""
+
+    def __init__(self):
+        self.slowdowns = load_slowdowns()
+        self._cache: dict[tuple[str, str, int], float] = {}
+
+    def colocation_slowdown(self, benchmark: str) -> float:
+        measured = [self.slowdowns.get(benchmark, {}).get(i, 1.0) for i in COLOCATION_INTERFERENCES]
+        return 1 + COLOCATION_WEIGHT * (max(measured) - 1)
+
+    def alone(self, benchmark: str, node: str, nr_threads: int) -> float:
+        key = (benchmark, node, nr_threads)
+        if key not in self._cache:
+            measured = runtime(benchmark, nr_threads)
+            if measured is None:
+                raise ValueError(f"There are no part 2b measurements of {benchmark}")
+            self._cache[key] = measured * NODE_SPEEDS.get(node, 1.0)
+        return self._cache[key]
+
+    def predict(self, benchmark: str, node: str, nr_threads: int, shared: bool) -> float:
+        predicted = self.alone(benchmark, node, nr_threads)
+        return predicted * self.colocation_slowdown(benchmark) if shared else predicted
@@ -0,0 +1,157 @@
+"""
+Image warmup: pull the images of a run to the nodes that will run them before any timing starts.
+
+Images are pulled in parallel on every node (and in parallel across nodes), and the digest each node ended up with is
+checked against the digest the registry currently serves for the tag (or, if the registry cannot be reached, against
+the other nodes). Manifests rendered afterwards reference the image by that digest with `imagePullPolicy:
+IfNotPresent`, so starting a job no longer includes a registry round-trip.
+"""
+
+import json
+import time
+import urllib.request
+from typing import Optional
+
+import yaml
+from loguru import logger
+
+from scripts.tracing import traced
+from scripts.utils import BACKEND, fan_out, ssh_command
+
+
+REGISTRY = "https://registry-1.docker.io"
+REGISTRY_AUTH = "https://auth.docker.io/token?service=registry.docker.io&scope=repository:{repository}:pull"
+MANIFEST_TYPES = [
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+    "application/vnd.oci.image.manifest.v1+json",
+]
+
+# How a node's container runtime pulls an image and prints the `<repository>@<digest>` it got
+RUNTIMES = {
+    "containerd": (
+        "sudo crictl pull {image} >/dev/null",
+        "sudo crictl inspecti -o json {image} | python3 -c "
+        "'import json, sys; print(json.load(sys.stdin)[\"status\"][\"repoDigests\"][0])'",
+    ),
+    "docker": (
+        "sudo docker pull -q {image} >/dev/null",
+        "sudo docker image inspect --format '{{{{index .RepoDigests 0}}}}' {image}",
+    ),
+}
+
+# Image (as written in the manifests) -> digest verified on every node that will run it
+WARM_IMAGES: dict[str, str] = {}
+
+
+class ImageDigestMismatch(Exception):
+    pass
+
+
+def split_image(image: str) -> tuple[str, str]:
+    # anakli/cca:parsec_canneal -> (anakli/cca, parsec_canneal)
+    repository, _, tag = image.rpartition(":")
+    if repository == "" or "/" in tag:
+        return image, "latest"
+    return repository, tag
+
+
+def resolve_digest(image: str) -> Optional[str]:
+    """Digest the registry currently serves for the image's tag, or None if it cannot be reached."""
+    repository, tag = split_image(image)
+    if "/" not in repository:
+        repository = f"library/{repository}"
+    try:
+        with urllib.request.urlopen(REGISTRY_AUTH.format(repository=repository), timeout=10) as response:
+            token = json.load(response)["token"]
+        request = urllib.request.Request(
+            f"{REGISTRY}/v2/{repository}/manifests/{tag}",
+            method="HEAD",
+            headers={"Authorization": f"Bearer {token}", "Accept": ", ".join(MANIFEST_TYPES)},
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.headers.get("Docker-Content-Digest")
+    except (OSError, KeyError, ValueError) as e:
+        logger.warning(f"Could not resolve the digest of {image}: {e}")
+        return None
+
+
+def manifest_images(manifest_files: list[str]) -> dict[str, set[str]]:
+    """Node type (`cca-project-nodetype` selector) -> images of the pods and jobs in the manifests."""
+    images: dict[str, set[str]] = {}
+    for manifest_file in manifest_files:
+        with open(manifest_file) as f:
+            for document in yaml.safe_load_all(f):
+                if document is None:
+                    continue
+                pod_spec = document["spec"]["template"]["spec"] if document["kind"] == "Job" else document["spec"]
+                node_type = pod_spec.get("nodeSelector", {}).get("cca-project-nodetype", "")
+                for container in pod_spec["containers"]:
+                    images.setdefault(node_type, set()).add(container["image"])
+    return images
+
+
+def _pull_on_node(node: str, images: list[str], runtime: str) -> dict[str, str]:
+    pull, inspect = RUNTIMES[runtime]
+    pulls = " ".join(f"({pull.format(image=image)}) &" for image in images)
+    inspects = "; ".join(f"echo {image} $({inspect.format(image=image)})" for image in images)
+
+    start = time.monotonic()
+    res = ssh_command(node, f"{pulls} wait; {inspects}")
+    logger.info(f"Pulled {len(images)} images on {node} in {time.monotonic() - start:.1f}s")
+
+    # Output: <image> <repository>@<digest>
+    digests = {}
+    for line in res.stdout.decode("utf-8").splitlines():  # type: ignore
+        parts = line.split()
+        if len(parts) == 2 and "@" in parts[1]:
+            digests[parts[0]] = parts[1].split("@", 1)[1]
+    return digests
+
+
+@traced("images")
+def warm_up(images_by_node: dict[str, set[str]], runtime: str = "containerd") -> dict[str, str]:
+    """
+    Pulls the images to every node whose name starts with the given prefix (or node type) and verifies their digests.
+    Returns the verified digest per image and raises ImageDigestMismatch if a node ended up with a different image.
+    """
+    if BACKEND.simulated:
+        logger.info("Simulated cluster, there are no images to pull")
+        return {}
+
+    all_images = sorted({image for images in images_by_node.values() for image in images})
+    expected = {image: resolve_digest(image) for image in all_images}
+
+    def images_for(node: str) -> list[str]:
+        matching = [images for prefix, images in images_by_node.items() if node.startswith(prefix)]
+        return sorted(set().union(*matching))
+
+    # All nodes pull at the same time
+    results = fan_out(
+        tuple(images_by_node), lambda node: _pull_on_node(node, images_for(node), runtime), fail_fast=True
+    )
+
+    # Image -> node -> digest it got (None if the pull failed)
+    on_nodes: dict[str, dict[str, Optional[str]]] = {image: {} for image in all_images}
+    for result in results:
+        for image in images_for(result.node):
+            on_nodes[image][result.node] = result.output.get(image)
+
+    for image in all_images:
+        found = set(on_nodes[image].values())
+        reference = expected[image] or (found.pop() if len(found) == 1 else None)
+        if reference is None or any(digest != reference for digest in on_nodes[image].values()):
+            raise ImageDigestMismatch(f"{image}: expected {expected[image]}, got {on_nodes[image]}")
+        WARM_IMAGES[image] = reference
+        logger.success(f"{image} is cached on {len(on_nodes[image])} nodes ({reference})")
+    return dict(WARM_IMAGES)
+
+
+def pinned_image(image: str) -> Optional[str]:
+    """The image referenced by its verified digest if it was warmed up, else None."""
+    digest = WARM_IMAGES.get(image)
+    if digest is None:
+        return None
+    repository, _ = split_image(image)
+    return f"{repository}@{digest}"
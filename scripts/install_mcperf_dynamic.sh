@@ -1,9 +1,14 @@
 #!/bin/bash
+# Usage: install_mcperf_dynamic.sh [revision]
 sudo sh -c "echo deb-src http://europe-west3.gce.archive.ubuntu.com/ubuntu/ jammy main \
 restricted >> /etc/apt/sources.list"
 sudo apt-get update
 sudo apt-get install libevent-dev libzmq3-dev git make g++ --yes
 sudo apt-get build-dep memcached --yes
+rm -rf memcache-perf-dynamic
 git clone https://github.com/eth-easl/memcache-perf-dynamic.git
 cd memcache-perf-dynamic
-make
\ No newline at end of file
+if [ -n "$1" ]; then
+    git checkout "$1"
+fi
+make
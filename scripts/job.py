@@ -1,13 +1,23 @@
-import yaml
-import tempfile
+import json
 import os
+import threading
+import time
+from typing import Optional
 from loguru import logger
 
-from scripts.utils import pods_completed, run_command
+from scripts.image_cache import pinned_image
+from scripts.kube_client import PodInfo
+from scripts.manifests import Overrides, apply_manifests, load_template
+from scripts.utils import BACKEND
 
 
 PARSEC_PATH = os.path.join(".", "yaml_files_part3")
 
+# Pod states in which the benchmark's container has started
+STARTED_STATES = {"Running", "Completed", "Error"}
+# Pod states in which the benchmark has finished (successfully or not)
+FINISHED_STATES = {"Completed", "Error"}
+
 
 class Job:
     def __init__(
@@ -27,74 +37,152 @@ class Job:
         self.nr_threads = nr_threads
         self.benchmark_suite = benchmark_suite
         self.depends_on = depends_on
-        self.file = self._create_file()
+        self.template = load_template(os.path.join(PARSEC_PATH, f"parsec-{self.job_name}.yaml"))
+        self.image = self.template.image
         self.is_finished_prop = False
         self.started = False
-
-    def _create_file(self):
-        return modified_yaml_file(
-            os.path.join(PARSEC_PATH, f"parsec-{self.job_name}.yaml"),
-            selector=node_selector(self.node_selector),
-            container_args=container_args(
-                self.cores, self.benchmark, self.nr_threads, benchmark_suite=self.benchmark_suite
-            ),
+        # Wall clock times at which the dependencies had finished, the manifest was submitted and the pod was first
+        # seen running
+        self.ready_at: Optional[float] = None
+        self.submitted_at: Optional[float] = None
+        self.running_at: Optional[float] = None
+
+    def render(self) -> dict:
+        # Once the image was pulled to the nodes (see image_cache), the job must not go to the registry again
+        pinned = pinned_image(self.image)
+        return self.template.render(
+            Overrides(
+                node_selector=self.node_selector,
+                cpuset=self.cores,
+                nr_threads=self.nr_threads,
+                benchmark_suite=self.benchmark_suite,
+                benchmark=self.benchmark,
+                image=pinned,
+                image_pull_policy="IfNotPresent" if pinned is not None else None,
+            )
         )
 
+    def owns(self, pod: PodInfo) -> bool:
+        # The job controller labels the pods it creates with the name of their job
+        return pod.labels.get("job-name") == self.template.name
+
+    def has_finished(self, pods: list[PodInfo]) -> bool:
+        job_pods = [pod for pod in pods if self.owns(pod)]
+        return len(job_pods) > 0 and all(pod.status in FINISHED_STATES for pod in job_pods)
+
     @property
     def is_finished(self):
-        self.is_finished_prop = self.is_finished_prop or pods_completed(self.job_name)
+        # Reads the state kept up to date by the shared pod watch, so this does not query the API server
+        self.is_finished_prop = self.is_finished_prop or self.has_finished(BACKEND.items("pods"))
         return self.is_finished_prop
 
-    def start(self):
+    @property
+    def is_runnable(self) -> bool:
         if self.started:
-            return
+            return False
         for job in self.depends_on:
             if not job.is_finished:
                 logger.info(f"{self.job_name} is waiting for {job.job_name} to finish. Try again later.")
-                return
-        run_command(f"kubectl create -f {self.file.name}".split())
-        self.started = True
-        logger.info(f"Started job {self.job_name}")
-        self.file.close()
-
-
-def __taskset_command(cores: str, benchmark_name: str, nr_threads: int, benchmark_suite="parsec") -> list:
-    # args: ["-c", "taskset -c 4,5,6 ./run -a run -S parsec -p canneal -i native -n 3"]
-    return [
-        "-c",
-        f"taskset -c {cores} ./run -a run -S {benchmark_suite} -p {benchmark_name} -i native -n {nr_threads}",
-    ]
+                return False
+        return True
 
+    @property
+    def queueing_delay(self) -> Optional[float]:
+        if self.ready_at is None or self.submitted_at is None:
+            return None
+        return self.submitted_at - self.ready_at
 
-def container_args(cores: str, benchmark: str, nr_threads: int, benchmark_suite="parsec") -> tuple:
-    return ["spec", "template", "spec", "containers", 0, "args"], __taskset_command(
-        cores, benchmark, nr_threads, benchmark_suite=benchmark_suite
-    )
+    @property
+    def start_latency(self) -> Optional[float]:
+        if self.submitted_at is None or self.running_at is None:
+            return None
+        return self.running_at - self.submitted_at
 
+    def start(self):
+        submit_jobs([self])
 
-def node_selector(selector_value: str) -> tuple:
-    return ["spec", "template", "spec", "nodeSelector", "cca-project-nodetype"], selector_value
 
+class StartLatencies:
+    """
+    Records when the pods of submitted jobs are first seen running, from the shared pod watch (in a background thread
+    per submission), so that the submit-to-running latency and the start skew of a run are measured.
+    """
 
-def modified_yaml_file(file_path, **kwargs):
+    def __init__(self):
+        self.jobs: list[Job] = []
+        self._threads: list[threading.Thread] = []
+
+    def track(self, jobs: list[Job], timeout: float = 600) -> None:
+        self.jobs.extend(jobs)
+        thread = threading.Thread(target=self._watch, args=(jobs, timeout), daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    @staticmethod
+    def _watch(jobs: list[Job], timeout: float) -> None:
+        def record(pods: list[PodInfo]) -> bool:
+            now = time.time()
+            for job in jobs:
+                if job.running_at is None and any(job.owns(pod) and pod.status in STARTED_STATES for pod in pods):
+                    job.running_at = now
+            return all(job.running_at is not None for job in jobs)
+
+        BACKEND.wait_for("pods", record, timeout=timeout)
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def report(self) -> dict:
+        running = [job.running_at for job in self.jobs if job.running_at is not None]
+        return {
+            "jobs": {
+                job.job_name: {
+                    "ready_at": job.ready_at,
+                    "submitted_at": job.submitted_at,
+                    "running_at": job.running_at,
+                    "queueing_delay": job.queueing_delay,
+                    "start_latency": job.start_latency,
+                }
+                for job in self.jobs
+            },
+            # Time between the first and the last job that started running
+            "start_skew": max(running) - min(running) if len(running) > 0 else None,
+        }
+
+    def save(self, path: str) -> None:
+        report = self.report()
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        for job_name, latencies in report["jobs"].items():
+            if latencies["queueing_delay"] is not None:
+                logger.info(f"{job_name} was submitted {latencies['queueing_delay'] * 1000:.1f}ms after it was ready")
+            if latencies["start_latency"] is not None:
+                logger.info(f"{job_name} was running {latencies['start_latency']:.2f}s after it was submitted")
+        if report["start_skew"] is not None:
+            logger.info(f"Start skew: {report['start_skew']:.2f}s")
+
+
+START_LATENCIES = StartLatencies()
+
+
+def submit_jobs(jobs: list[Job]) -> list[Job]:
     """
-    Usage example:
-        modify_yaml_file("file.yaml", lambda file: run_command(f"cat {file.name}"), value1=([key1, subkey2], "modified_value"))
+    Submits all jobs that are runnable right now (not started, dependencies finished) as a single multi-document
+    manifest, so that they start at the same time instead of one `kubectl` call apart. Returns the submitted jobs.
     """
-    with open(file_path, "r") as f:
-        data = yaml.safe_load(f)
-
-    # Traverse the attribute path and update the value
-    for attribute_path, new_value in kwargs.values():
-        current_node = data
-        for key in attribute_path[:-1]:
-            current_node = current_node[key]
-        if current_node:
-            current_node[attribute_path[-1]] = new_value
-        else:
-            raise ValueError(f"Attribute path '{attribute_path}' not found in YAML")
-
-    # Write modified data to a temporary file
-    temp_file = tempfile.NamedTemporaryFile(mode="w")
-    yaml.dump(data, temp_file, default_flow_style=False)
-    return temp_file
+    runnable = [job for job in jobs if job.is_runnable]
+    if len(runnable) == 0:
+        return []
+
+    # Rendered only now, so that they pick up the images warmed up after the jobs were defined
+    manifests = [job.render() for job in runnable]
+    submitted_at = time.time()
+    apply_manifests(manifests)
+    for job in runnable:
+        job.started = True
+        job.submitted_at = submitted_at
+    START_LATENCIES.track(runnable)
+
+    logger.info(f"Started jobs {', '.join(job.job_name for job in runnable)}")
+    return runnable
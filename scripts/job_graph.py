@@ -0,0 +1,91 @@
+"""
+Executes a set of jobs in the order given by their `depends_on`.
+
+Instead of polling every job once per second, the executor blocks on the shared pod watch and is woken up by the
+update in which a dependency's pod completes. All jobs released by that update are submitted together right away, so
+a chained job (e.g. dedup after radix) starts as soon as its predecessor is done. The executor returns once the pods of
+all jobs have finished.
+"""
+
+import time
+from typing import Optional
+
+from loguru import logger
+
+from scripts.job import Job, submit_jobs
+from scripts.kube_client import PodInfo
+from scripts.tracing import span
+from scripts.utils import BACKEND
+
+
+class DependencyCycle(Exception):
+    pass
+
+
+class JobGraph:
+    def __init__(self, jobs: list[Job]):
+        # Dependencies that were not passed explicitly are part of the graph as well
+        self.jobs: list[Job] = []
+        pending = list(jobs)
+        while len(pending) > 0:
+            job = pending.pop(0)
+            if job not in self.jobs:
+                self.jobs.append(job)
+                pending.extend(job.depends_on)
+        self._check_acyclic()
+
+    def _check_acyclic(self) -> None:
+        # Depth-first search, a dependency that is still on the stack closes a cycle
+        visited: set[Job] = set()
+        stack: list[Job] = []
+
+        def visit(job: Job) -> None:
+            if job in stack:
+                cycle = stack[stack.index(job) :] + [job]
+                raise DependencyCycle(" -> ".join(j.job_name for j in cycle))
+            if job in visited:
+                return
+            stack.append(job)
+            for dependency in job.depends_on:
+                visit(dependency)
+            stack.pop()
+            visited.add(job)
+
+        for job in self.jobs:
+            visit(job)
+
+    def released(self) -> list[Job]:
+        """Jobs that were not started yet and whose dependencies have all finished."""
+        return [
+            job
+            for job in self.jobs
+            if not job.started and all(dependency.is_finished_prop for dependency in job.depends_on)
+        ]
+
+    def _newly_finished(self, pods: list[PodInfo]) -> list[Job]:
+        return [job for job in self.jobs if job.started and not job.is_finished_prop and job.has_finished(pods)]
+
+    def run(self, timeout: Optional[float] = None) -> None:
+        """Submits every job as soon as its dependencies have finished. Returns once all jobs have finished."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        for job in self.released():
+            job.ready_at = time.time()
+        submit_jobs(self.released())
+
+        while any(not job.is_finished_prop for job in self.jobs):
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            with span("waiting for jobs", "wait"):
+                if not BACKEND.wait_for("pods", lambda pods: len(self._newly_finished(pods)) > 0, timeout=remaining):
+                    waiting = [job.job_name for job in self.jobs if not job.is_finished_prop]
+                    raise TimeoutError(f"Timed out while waiting for {', '.join(waiting)} to finish")
+
+            now = time.time()
+            for job in self._newly_finished(BACKEND.items("pods")):
+                job.is_finished_prop = True
+                logger.info(f"{job.job_name} has finished")
+
+            released = self.released()
+            for job in released:
+                job.ready_at = now
+            submit_jobs(released)
@@ -0,0 +1,352 @@
+"""
+Minimal in-process client for the Kubernetes API server.
+
+Instead of spawning `kubectl get ... -o wide` and splitting its table output, we keep one keep-alive HTTPS connection
+per thread to the API server (credentials are taken from the current kubeconfig context) and parse the JSON objects
+into typed records.
+
+Set KUBE_API_SERVER (e.g. `http://127.0.0.1:8001` for `kubectl proxy` or a local stand-in server, see kube_stand_in)
+to bypass the kubeconfig and talk plain HTTP without authentication.
+"""
+
+import atexit
+import base64
+import http.client
+import json
+import os
+import ssl
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+from urllib.parse import urlencode, urlparse
+
+import yaml
+
+
+NAMESPACE = "default"
+REQUEST_TIMEOUT = 30
+# The API server ends a watch after this many seconds, after which it is resumed from the last resourceVersion
+WATCH_TIMEOUT = 300
+
+
+class KubeAPIError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Kubernetes API error {status}: {message}")
+        self.status = status
+
+
+def _age(creation_timestamp: Optional[str]) -> str:
+    if creation_timestamp is None:
+        return "<unknown>"
+    created = datetime.strptime(creation_timestamp, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    seconds = int((datetime.now(timezone.utc) - created).total_seconds())
+    if seconds < 120:
+        return f"{seconds}s"
+    if seconds < 7200:
+        return f"{seconds // 60}m"
+    return f"{seconds // 3600}h"
+
+
+@dataclass
+class NodeInfo:
+    name: str
+    status: str
+    roles: str
+    age: str
+    version: str
+    internal_ip: Optional[str]
+    external_ip: Optional[str]
+    labels: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_json(cls, obj: dict) -> "NodeInfo":
+        metadata, status = obj["metadata"], obj.get("status", {})
+        labels = metadata.get("labels", {})
+        addresses = {address["type"]: address["address"] for address in status.get("addresses", [])}
+        ready = [c for c in status.get("conditions", []) if c["type"] == "Ready" and c["status"] == "True"]
+        roles = [label.split("/", 1)[1] for label in labels if label.startswith("node-role.kubernetes.io/")]
+        return cls(
+            name=metadata["name"],
+            status="Ready" if ready else "NotReady",
+            roles=",".join(roles) or "<none>",
+            age=_age(metadata.get("creationTimestamp")),
+            version=status.get("nodeInfo", {}).get("kubeletVersion", ""),
+            internal_ip=addresses.get("InternalIP"),
+            external_ip=addresses.get("ExternalIP"),
+            labels=labels,
+        )
+
+    def row(self) -> list[str]:
+        # Same columns as `kubectl get nodes -o wide`
+        return [
+            self.name,
+            self.status,
+            self.roles,
+            self.age,
+            self.version,
+            self.internal_ip or "<none>",
+            self.external_ip or "<none>",
+        ]
+
+
+@dataclass
+class PodInfo:
+    name: str
+    ready: str
+    status: str
+    restarts: int
+    age: str
+    ip: Optional[str]
+    node: Optional[str]
+    labels: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_json(cls, obj: dict) -> "PodInfo":
+        metadata, status = obj["metadata"], obj.get("status", {})
+        container_statuses = status.get("containerStatuses", [])
+
+        # Mirror the STATUS column of kubectl: a container's waiting/terminated reason wins over the pod phase
+        display_status = status.get("phase", "Unknown")
+        for container_status in container_statuses:
+            state = container_status.get("state", {})
+            if "terminated" in state:
+                display_status = state["terminated"].get("reason", "Terminated")
+            elif "waiting" in state:
+                display_status = state["waiting"].get("reason", "Waiting")
+
+        nr_ready = len([c for c in container_statuses if c.get("ready")])
+        nr_containers = len(obj.get("spec", {}).get("containers", [])) or len(container_statuses)
+        return cls(
+            name=metadata["name"],
+            ready=f"{nr_ready}/{nr_containers}",
+            status=display_status,
+            restarts=sum(c.get("restartCount", 0) for c in container_statuses),
+            age=_age(metadata.get("creationTimestamp")),
+            ip=status.get("podIP"),
+            node=obj.get("spec", {}).get("nodeName"),
+            labels=metadata.get("labels", {}),
+        )
+
+    def row(self) -> list[str]:
+        # Same columns as `kubectl get pods -o wide`
+        return [
+            self.name,
+            self.ready,
+            self.status,
+            str(self.restarts),
+            self.age,
+            self.ip or "<none>",
+            self.node or "<none>",
+        ]
+
+
+@dataclass
+class JobInfo:
+    name: str
+    succeeded: int
+    completions: int
+    age: str
+
+    @classmethod
+    def from_json(cls, obj: dict) -> "JobInfo":
+        metadata = obj["metadata"]
+        return cls(
+            name=metadata["name"],
+            succeeded=obj.get("status", {}).get("succeeded", 0),
+            completions=obj.get("spec", {}).get("completions", 1),
+            age=_age(metadata.get("creationTimestamp")),
+        )
+
+    def row(self) -> list[str]:
+        return [self.name, f"{self.succeeded}/{self.completions}", self.age]
+
+
+@dataclass
+class ServiceInfo:
+    name: str
+    type: str
+    cluster_ip: Optional[str]
+    external_ip: str
+    ports: str
+    age: str
+
+    @classmethod
+    def from_json(cls, obj: dict) -> "ServiceInfo":
+        metadata, spec = obj["metadata"], obj.get("spec", {})
+        service_type = spec.get("type", "ClusterIP")
+
+        external_ip = "<none>"
+        if service_type == "LoadBalancer":
+            ingress = obj.get("status", {}).get("loadBalancer", {}).get("ingress", [])
+            external_ip = ingress[0].get("ip", ingress[0].get("hostname")) if ingress else "<pending>"
+
+        ports = ",".join(f"{port['port']}/{port.get('protocol', 'TCP')}" for port in spec.get("ports", []))
+        return cls(
+            name=metadata["name"],
+            type=service_type,
+            cluster_ip=spec.get("clusterIP"),
+            external_ip=external_ip,
+            ports=ports or "<none>",
+            age=_age(metadata.get("creationTimestamp")),
+        )
+
+    def row(self) -> list[str]:
+        return [self.name, self.type, self.cluster_ip or "<none>", self.external_ip, self.ports, self.age]
+
+
+def _write_temp(data: str) -> str:
+    fd, path = tempfile.mkstemp(prefix="cca-kube-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(base64.b64decode(data))
+    atexit.register(os.remove, path)
+    return path
+
+
+class KubeClient:
+    def __init__(self, server: str, ssl_context: Optional[ssl.SSLContext] = None, headers: Optional[dict] = None):
+        url = urlparse(server)
+        self.scheme = url.scheme
+        self.host = url.hostname or "localhost"
+        self.port = url.port
+        self.ssl_context = ssl_context
+        self.headers = {"Accept": "application/json", **(headers or {})}
+        self._local = threading.local()
+
+    @classmethod
+    def from_kubeconfig(cls, path: Optional[str] = None) -> "KubeClient":
+        path = path or os.environ.get("KUBECONFIG", "~/.kube/config").split(os.pathsep)[0]
+        with open(os.path.expanduser(path), "r") as f:
+            config = yaml.safe_load(f)
+
+        context_name = config["current-context"]
+        context = next(c["context"] for c in config["contexts"] if c["name"] == context_name)
+        cluster = next(c["cluster"] for c in config["clusters"] if c["name"] == context["cluster"])
+        user = next((u["user"] for u in config.get("users", []) if u["name"] == context.get("user")), {})
+
+        ssl_context = ssl.create_default_context()
+        if cluster.get("insecure-skip-tls-verify"):
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+        elif "certificate-authority-data" in cluster:
+            ssl_context.load_verify_locations(cadata=base64.b64decode(cluster["certificate-authority-data"]).decode())
+        elif "certificate-authority" in cluster:
+            ssl_context.load_verify_locations(cafile=os.path.expanduser(cluster["certificate-authority"]))
+
+        headers = {}
+        if "client-certificate-data" in user:
+            ssl_context.load_cert_chain(
+                _write_temp(user["client-certificate-data"]), _write_temp(user["client-key-data"])
+            )
+        elif "client-certificate" in user:
+            ssl_context.load_cert_chain(
+                os.path.expanduser(user["client-certificate"]), os.path.expanduser(user["client-key"])
+            )
+        if "token" in user:
+            headers["Authorization"] = f"Bearer {user['token']}"
+        elif "username" in user:
+            credentials = base64.b64encode(f"{user['username']}:{user['password']}".encode()).decode()
+            headers["Authorization"] = f"Basic {credentials}"
+
+        return cls(cluster["server"], ssl_context=ssl_context, headers=headers)
+
+    @classmethod
+    def from_env(cls) -> "KubeClient":
+        server = os.environ.get("KUBE_API_SERVER")
+        if server is not None:
+            return cls(server)
+        return cls.from_kubeconfig()
+
+    def connect(self, timeout: Optional[float] = REQUEST_TIMEOUT) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=timeout, context=self.ssl_context)
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def _connection(self) -> http.client.HTTPConnection:
+        # http.client connections are not thread-safe, so every thread keeps its own keep-alive connection
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self.connect()
+            self._local.connection = connection
+        return connection
+
+    def request(self, method: str, path: str, params: Optional[dict] = None, body: Optional[dict] = None) -> dict:
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {**self.headers, "Content-Type": "application/json"} if payload is not None else self.headers
+
+        # A keep-alive connection may have been closed by the server in the meantime, so we retry once
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                self._local.connection = None
+                if attempt == 1:
+                    raise
+
+        if response.status >= 400:
+            try:
+                message = json.loads(data).get("message", "")
+            except ValueError:
+                message = data.decode("utf-8", errors="replace")
+            raise KubeAPIError(response.status, message)
+        return json.loads(data) if data else {}
+
+    def get(self, path: str, params: Optional[dict] = None) -> dict:
+        return self.request("GET", path, params=params)
+
+    def watch(self, path: str, resource_version: str) -> Iterator[tuple[str, dict]]:
+        """
+        Yields (event type, object) pairs of a watch stream. Every watch gets its own connection since the response
+        occupies it until the server closes the stream.
+        """
+        params = {"watch": "1", "resourceVersion": resource_version, "timeoutSeconds": str(WATCH_TIMEOUT)}
+        connection = self.connect(timeout=WATCH_TIMEOUT + REQUEST_TIMEOUT)
+        try:
+            connection.request("GET", f"{path}?{urlencode(params)}", headers=self.headers)
+            response = connection.getresponse()
+            if response.status >= 400:
+                raise KubeAPIError(response.status, response.read().decode("utf-8", errors="replace"))
+
+            while True:
+                line = response.readline()
+                if not line:
+                    return
+                if line.strip():
+                    event = json.loads(line)
+                    yield event["type"], event["object"]
+        finally:
+            connection.close()
+
+    def list_nodes(self) -> list[NodeInfo]:
+        return [NodeInfo.from_json(item) for item in self.get("/api/v1/nodes")["items"]]
+
+    def list_pods(self, namespace: str = NAMESPACE) -> list[PodInfo]:
+        return [PodInfo.from_json(item) for item in self.get(f"/api/v1/namespaces/{namespace}/pods")["items"]]
+
+    def list_jobs(self, namespace: str = NAMESPACE) -> list[JobInfo]:
+        return [JobInfo.from_json(item) for item in self.get(f"/apis/batch/v1/namespaces/{namespace}/jobs")["items"]]
+
+    def list_services(self, namespace: str = NAMESPACE) -> list[ServiceInfo]:
+        return [
+            ServiceInfo.from_json(item) for item in self.get(f"/api/v1/namespaces/{namespace}/services")["items"]
+        ]
+
+
+_client: Optional[KubeClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> KubeClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = KubeClient.from_env()
+        return _client
@@ -0,0 +1,118 @@
+"""
+A local stand-in for the Kubernetes API server, serving a fixed set of pods, and a check of KubeClient against it.
+
+The stand-in answers `GET /api/v1/namespaces/default/pods` with a pod list, and the same path with `?watch=1` with a
+chunked stream of watch events, so that list parsing, the typed rows and watch streaming are exercised without a
+cluster. Run the check with `python -m scripts.kube_stand_in`.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from loguru import logger
+
+from scripts.kube_client import NAMESPACE, KubeClient, PodInfo
+
+
+PODS_PATH = f"/api/v1/namespaces/{NAMESPACE}/pods"
+
+PODS = [
+    {
+        "metadata": {"name": "some-memcached", "labels": {"name": "some-memcached"}},
+        "spec": {"nodeName": "node-a-2core-0000", "containers": [{"name": "memcached"}]},
+        "status": {
+            "phase": "Running",
+            "podIP": "100.96.1.2",
+            "containerStatuses": [{"ready": True, "restartCount": 1, "state": {"running": {}}}],
+        },
+    },
+    {
+        "metadata": {"name": "parsec-dedup-abcde", "labels": {"job-name": "parsec-dedup"}},
+        "spec": {"nodeName": "node-c-8core-0000", "containers": [{"name": "parsec-dedup"}]},
+        "status": {
+            "phase": "Succeeded",
+            "podIP": "100.96.3.4",
+            "containerStatuses": [{"ready": False, "state": {"terminated": {"reason": "Completed"}}}],
+        },
+    },
+]
+
+WATCH_EVENTS = [
+    {"type": "MODIFIED", "object": PODS[0]},
+    {"type": "DELETED", "object": PODS[1]},
+]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Keep-alive, as the client reuses its connection
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path != PODS_PATH:
+            self._send_json(404, {"kind": "Status", "message": f"{url.path} not found"})
+        elif parse_qs(url.query).get("watch") == ["1"]:
+            self._send_watch()
+        else:
+            self._send_json(200, {"kind": "PodList", "metadata": {"resourceVersion": "42"}, "items": PODS})
+
+    def _send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_watch(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        stream = b"".join(json.dumps(event).encode() + b"\n" for event in WATCH_EVENTS)
+        # Chunk boundaries do not line up with the events, as with a real API server
+        for start in range(0, len(stream), 64):
+            chunk = stream[start : start + 64]
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.close_connection = True
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"[stand-in] {format % args}")
+
+
+def serve() -> ThreadingHTTPServer:
+    """Starts the stand-in on a free local port, its address is `http://127.0.0.1:<server.server_port>`."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, name="kube-stand-in", daemon=True).start()
+    return server
+
+
+def check() -> None:
+    server = serve()
+    try:
+        client = KubeClient(f"http://127.0.0.1:{server.server_port}")
+
+        pods = client.list_pods()
+        assert [pod.name for pod in pods] == ["some-memcached", "parsec-dedup-abcde"], pods
+        assert pods[0].row()[:4] == ["some-memcached", "1/1", "Running", "1"], pods[0].row()
+        assert pods[0].row()[5:] == ["100.96.1.2", "node-a-2core-0000"], pods[0].row()
+        assert pods[1].row()[:3] == ["parsec-dedup-abcde", "0/1", "Completed"], pods[1].row()
+        assert pods[1].labels == {"job-name": "parsec-dedup"}, pods[1].labels
+
+        # The second request goes over the same keep-alive connection
+        assert client.get(PODS_PATH)["metadata"]["resourceVersion"] == "42"
+
+        events = [(event_type, PodInfo.from_json(obj).name) for event_type, obj in client.watch(PODS_PATH, "42")]
+        assert events == [("MODIFIED", "some-memcached"), ("DELETED", "parsec-dedup-abcde")], events
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    logger.success("KubeClient parses pod lists, rows and watch streams of the stand-in API server")
+
+
+if __name__ == "__main__":
+    check()
@@ -0,0 +1,127 @@
+"""
+Event-driven waiting on cluster state.
+
+A ResourceWatch lists one resource type once and then follows the API server's watch stream for it, keeping the
+current objects in memory. Any number of waiters can block on a predicate over these objects; they are woken up on
+every event, so a wait returns as soon as the condition holds instead of at the next poll. All waiters on the same
+resource type share one watch connection.
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+from loguru import logger
+
+from scripts.kube_client import NAMESPACE, JobInfo, KubeAPIError, KubeClient, PodInfo, ServiceInfo, get_client
+
+
+RESOURCES = {
+    "pods": (f"/api/v1/namespaces/{NAMESPACE}/pods", PodInfo),
+    "jobs": (f"/apis/batch/v1/namespaces/{NAMESPACE}/jobs", JobInfo),
+    "services": (f"/api/v1/namespaces/{NAMESPACE}/services", ServiceInfo),
+}
+
+# Seconds to wait before re-establishing a watch that failed
+RECONNECT_DELAY = 1
+
+
+class ResourceWatch:
+    def __init__(self, client: KubeClient, resource_type: str):
+        self.client = client
+        self.resource_type = resource_type
+        self.path, self.record_type = RESOURCES[resource_type]
+
+        self.objects: dict[str, object] = {}
+        self.resource_version = ""
+        self._condition = threading.Condition()
+        self._listeners: list[Callable[[str, object], None]] = []
+
+        self._relist()
+        self._thread = threading.Thread(target=self._run, name=f"watch-{resource_type}", daemon=True)
+        self._thread.start()
+
+    def _relist(self) -> None:
+        res = self.client.get(self.path)
+        with self._condition:
+            self.objects = {item["metadata"]["name"]: self.record_type.from_json(item) for item in res["items"]}
+            self.resource_version = res["metadata"]["resourceVersion"]
+            self._condition.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                for event_type, obj in self.client.watch(self.path, self.resource_version):
+                    self._handle(event_type, obj)
+            except KubeAPIError as e:
+                logger.warning(f"Watch on {self.resource_type} failed ({e}), listing again")
+                time.sleep(RECONNECT_DELAY)
+                self._relist_safely()
+            except Exception as e:
+                logger.warning(f"Watch on {self.resource_type} interrupted ({e}), reconnecting")
+                time.sleep(RECONNECT_DELAY)
+
+    def _relist_safely(self) -> None:
+        try:
+            self._relist()
+        except Exception as e:
+            logger.warning(f"Could not list {self.resource_type}: {e}")
+
+    def _handle(self, event_type: str, obj: dict) -> None:
+        if event_type == "ERROR":
+            # Typically 410 Gone: our resourceVersion is too old and we have to start over from a fresh list
+            self._relist()
+            return
+        if event_type == "BOOKMARK":
+            self.resource_version = obj["metadata"]["resourceVersion"]
+            return
+
+        name = obj["metadata"]["name"]
+        record = self.record_type.from_json(obj)
+        with self._condition:
+            if event_type == "DELETED":
+                self.objects.pop(name, None)
+            else:
+                self.objects[name] = record
+            self.resource_version = obj["metadata"]["resourceVersion"]
+            listeners = list(self._listeners)
+            self._condition.notify_all()
+
+        for listener in listeners:
+            listener(event_type, record)
+
+    def items(self) -> list:
+        with self._condition:
+            return list(self.objects.values())
+
+    def add_listener(self, listener: Callable[[str, object], None]) -> None:
+        """Calls `listener(event_type, record)` from the watch thread on every change."""
+        with self._condition:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str, object], None]) -> None:
+        with self._condition:
+            self._listeners.remove(listener)
+
+    def wait_for(self, predicate: Callable[[list], bool], timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until `predicate(objects)` is true or the timeout (in seconds, None = forever) expires. Returns the
+        last value of the predicate.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: predicate(list(self.objects.values())), timeout=timeout)
+
+
+_watches: dict[str, ResourceWatch] = {}
+_watches_lock = threading.Lock()
+
+
+def get_watch(resource_type: str) -> ResourceWatch:
+    with _watches_lock:
+        if resource_type not in _watches:
+            _watches[resource_type] = ResourceWatch(get_client(), resource_type)
+        return _watches[resource_type]
+
+
+def wait_for(resource_type: str, predicate: Callable[[list], bool], timeout: Optional[float] = None) -> bool:
+    return get_watch(resource_type).wait_for(predicate, timeout=timeout)
@@ -0,0 +1,511 @@
+"""
+A simulated cluster on this machine (CCA_BACKEND=local).
+
+Nodes are read from a kops cluster file (CCA_LOCAL_CLUSTER, or the file passed to `kops create -f`) and get fake IPs,
+their `cca-project-nodetype` labels and a disjoint set of local CPUs (as many as their machine type has cores, wrapping
+around if this machine has fewer). Pods and jobs created with `kubectl create -f` run as local processes pinned to
+their node's CPUs according to the `taskset -c` of their container:
+
+- PARSEC/SPLASH-2x containers burn as many CPUs as they have threads for their measured runtime (see
+  `benchmark_profiles`), scaled by CCA_LOCAL_TIME_SCALE.
+- Every other container (e.g. memcached) idles until it is deleted.
+
+Commands for a node run in its own home directory under `.cache/local-cluster/<node>`. Privileged and package
+management commands (sudo, apt, pip, systemctl, docker) are skipped there, except `sudo kill/taskset/pgrep`.
+"""
+
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+import yaml
+from loguru import logger
+
+from scripts import benchmark_profiles
+from scripts.backend import ExecutionBackend
+from scripts.kube_client import JobInfo, NodeInfo, PodInfo, ServiceInfo
+
+
+LOCAL_CLUSTER_DIR = os.path.abspath(os.path.join(".", ".cache", "local-cluster"))
+SHIM_DIR = os.path.join(LOCAL_CLUSTER_DIR, "bin")
+
+# Simulated benchmark runtime = measured runtime * TIME_SCALE
+TIME_SCALE = float(os.environ.get("CCA_LOCAL_TIME_SCALE", "0.01"))
+# Seconds between checks for finished pod processes
+POLL_INTERVAL = 0.05
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+SUDO_SHIM = """#!/bin/sh
+# Simulated node: process management is run, privileged provisioning is skipped
+case "$1" in
+    kill|taskset|pgrep) exec "$@" ;;
+    *) echo "[local] skipped: sudo $*" ;;
+esac
+"""
+SKIP_SHIM = """#!/bin/sh
+echo "[local] skipped: $(basename "$0") $*"
+"""
+SKIPPED_COMMANDS = ["apt", "apt-get", "pip", "systemctl", "docker", "usermod"]
+
+# Burns `threads` CPUs for `duration` seconds
+BURN_SCRIPT = """
+import os, sys, time
+end = time.monotonic() + float(sys.argv[1])
+for _ in range(int(sys.argv[2]) - 1):
+    if os.fork() == 0:
+        break
+while time.monotonic() < end:
+    pass
+try:
+    while True:
+        os.wait()
+except ChildProcessError:
+    pass
+"""
+IDLE_SCRIPT = "import time\nwhile True:\n    time.sleep(3600)\n"
+
+
+def _timestamp(moment: float) -> str:
+    return datetime.fromtimestamp(moment, timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def _cores(machine_type: str) -> int:
+    # e2-standard-8 -> 8, n2d-highcpu-2 -> 2 (shared-core types like e2-small count as 2)
+    match = re.search(r"-(\d+)$", machine_type)
+    return int(match.group(1)) if match else 2
+
+
+@dataclass
+class LocalNode:
+    name: str
+    labels: dict[str, str]
+    cpus: list[int]
+    internal_ip: str
+    external_ip: str
+    created: float = field(default_factory=time.time)
+
+    @property
+    def home(self) -> str:
+        return os.path.join(LOCAL_CLUSTER_DIR, self.name)
+
+    def to_json(self) -> dict:
+        return {
+            "metadata": {"name": self.name, "labels": self.labels, "creationTimestamp": _timestamp(self.created)},
+            "status": {
+                "addresses": [
+                    {"type": "InternalIP", "address": self.internal_ip},
+                    {"type": "ExternalIP", "address": self.external_ip},
+                ],
+                "conditions": [{"type": "Ready", "status": "True"}],
+                "nodeInfo": {"kubeletVersion": "v1.28.6-local"},
+            },
+        }
+
+
+@dataclass
+class LocalPod:
+    name: str
+    container: str
+    node: LocalNode
+    ip: str
+    labels: dict[str, str]
+    process: subprocess.Popen
+    job: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+
+    def to_json(self) -> dict:
+        returncode = self.process.returncode
+        if self.finished is None:
+            phase, ready, state = "Running", True, {"running": {"startedAt": _timestamp(self.created)}}
+        else:
+            phase = "Succeeded" if returncode == 0 else "Failed"
+            ready = False
+            state = {
+                "terminated": {
+                    "reason": "Completed" if returncode == 0 else "Error",
+                    "exitCode": returncode,
+                    "startedAt": _timestamp(self.created),
+                    "finishedAt": _timestamp(self.finished),
+                }
+            }
+        return {
+            "metadata": {"name": self.name, "labels": self.labels, "creationTimestamp": _timestamp(self.created)},
+            "spec": {"nodeName": self.node.name, "containers": [{"name": self.container}]},
+            "status": {
+                "phase": phase,
+                "podIP": self.ip,
+                "containerStatuses": [{"name": self.container, "ready": ready, "restartCount": 0, "state": state}],
+            },
+        }
+
+
+@dataclass
+class LocalService:
+    name: str
+    type: str
+    cluster_ip: str
+    external_ip: str
+    ports: list[dict]
+    created: float = field(default_factory=time.time)
+
+    def to_json(self) -> dict:
+        ingress = [{"ip": self.external_ip}] if self.type == "LoadBalancer" else []
+        return {
+            "metadata": {"name": self.name, "creationTimestamp": _timestamp(self.created)},
+            "spec": {"type": self.type, "clusterIP": self.cluster_ip, "ports": self.ports},
+            "status": {"loadBalancer": {"ingress": ingress}},
+        }
+
+
+def _ok(stdout: str = "") -> subprocess.CompletedProcess[bytes]:
+    return subprocess.CompletedProcess([], 0, stdout.encode("utf-8"), b"")
+
+
+def _error(message: str) -> subprocess.CompletedProcess[bytes]:
+    return subprocess.CompletedProcess([], 1, b"", message.encode("utf-8"))
+
+
+class LocalBackend(ExecutionBackend):
+    name = "local"
+    simulated = True
+
+    def __init__(self, cluster_file: Optional[str] = None):
+        self.cluster_name: Optional[str] = None
+        self.nodes: dict[str, LocalNode] = {}
+        self.pods: dict[str, LocalPod] = {}
+        self.jobs: dict[str, list[str]] = {}
+        self.services: dict[str, LocalService] = {}
+
+        self._condition = threading.Condition()
+        self._reaper: Optional[threading.Thread] = None
+        self._counter = 0
+
+        self._write_shims()
+        if cluster_file is not None:
+            self.load_cluster(cluster_file)
+
+    @classmethod
+    def from_env(cls) -> "LocalBackend":
+        return cls(os.environ.get("CCA_LOCAL_CLUSTER", "part3.yaml"))
+
+    def _write_shims(self) -> None:
+        os.makedirs(SHIM_DIR, exist_ok=True)
+        shims = {"sudo": SUDO_SHIM, **{command: SKIP_SHIM for command in SKIPPED_COMMANDS}}
+        for command, script in shims.items():
+            path = os.path.join(SHIM_DIR, command)
+            with open(path, "w") as f:
+                f.write(script)
+            os.chmod(path, 0o755)
+
+    def _next(self) -> int:
+        self._counter += 1
+        return self._counter
+
+    def load_cluster(self, cluster_file: str) -> None:
+        with open(cluster_file) as f:
+            documents = [document for document in yaml.safe_load_all(f) if document is not None]
+
+        nr_cpus = os.cpu_count() or 1
+        next_cpu = 0
+        nodes = {}
+        for document in documents:
+            if document["kind"] == "Cluster":
+                self.cluster_name = document["metadata"]["name"]
+            if document["kind"] != "InstanceGroup":
+                continue
+
+            spec = document["spec"]
+            labels = {key: str(value) for key, value in spec.get("nodeLabels", {}).items()}
+            if spec.get("role") == "Master":
+                labels["node-role.kubernetes.io/control-plane"] = ""
+            for index in range(spec.get("maxSize", 1)):
+                cores = _cores(spec.get("machineType", ""))
+                cpus = [(next_cpu + core) % nr_cpus for core in range(cores)]
+                next_cpu += cores
+                name = f"{document['metadata']['name']}-{index:04d}"
+                nodes[name] = LocalNode(
+                    name,
+                    labels=labels,
+                    cpus=cpus,
+                    internal_ip=f"10.156.0.{len(nodes) + 2}",
+                    external_ip=f"203.0.113.{len(nodes) + 2}",
+                )
+                os.makedirs(nodes[name].home, exist_ok=True)
+
+        with self._condition:
+            self.nodes = nodes
+            self._condition.notify_all()
+        logger.info(f"Simulating {self.cluster_name} with nodes {', '.join(nodes)} on {nr_cpus} local CPUs")
+
+    # Cluster state
+
+    def _records(self, resource_type: str) -> list:
+        with self._condition:
+            if resource_type == "nodes":
+                return [NodeInfo.from_json(node.to_json()) for node in self.nodes.values()]
+            if resource_type == "pods":
+                return [PodInfo.from_json(pod.to_json()) for pod in self.pods.values()]
+            if resource_type == "jobs":
+                return [JobInfo.from_json(self._job_json(name)) for name in self.jobs]
+            if resource_type == "services":
+                return [ServiceInfo.from_json(service.to_json()) for service in self.services.values()]
+        raise ValueError(f"Unknown resource type {resource_type}")
+
+    def _job_json(self, name: str) -> dict:
+        pods = [self.pods[pod_name] for pod_name in self.jobs[name] if pod_name in self.pods]
+        succeeded = len([pod for pod in pods if pod.finished is not None and pod.process.returncode == 0])
+        return {"metadata": {"name": name}, "spec": {"completions": 1}, "status": {"succeeded": succeeded}}
+
+    def list_objects(self, resource_type: str) -> list:
+        return self._records(resource_type)
+
+    def wait_for(self, resource_type: str, predicate: Callable[[list], bool], timeout: Optional[float] = None) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: predicate(self._records(resource_type)), timeout=timeout)
+
+    def _reap(self) -> None:
+        while True:
+            time.sleep(POLL_INTERVAL)
+            with self._condition:
+                for pod in self.pods.values():
+                    if pod.finished is None and pod.process.poll() is not None:
+                        pod.finished = time.time()
+                        logger.info(f"[local] {pod.name} finished with {pod.process.returncode}")
+                        self._condition.notify_all()
+
+    # Pods and jobs
+
+    def _select_node(self, pod_spec: dict) -> LocalNode:
+        selector = pod_spec.get("nodeSelector", {})
+        for node in self.nodes.values():
+            if all(node.labels.get(key) == str(value) for key, value in selector.items()):
+                if "node-role.kubernetes.io/control-plane" not in node.labels:
+                    return node
+        raise ValueError(f"No node matches {selector}")
+
+    def _workload(self, container: dict, node: LocalNode) -> tuple[list[str], list[int]]:
+        """The local command simulating the container, and the local CPUs it is pinned to."""
+        shell_command = " ".join(container.get("args", container.get("command", [])))
+
+        cpus = node.cpus
+        taskset = re.search(r"taskset -c ([\d,-]+)", shell_command)
+        if taskset is not None:
+            cores = []
+            for part in taskset.group(1).split(","):
+                start, _, end = part.partition("-")
+                cores.extend(range(int(start), int(end or start) + 1))
+            cpus = sorted({node.cpus[core % len(node.cpus)] for core in cores})
+
+        benchmark = re.search(r"-p (\w+)", shell_command)
+        threads = re.search(r"-n (\d+)", shell_command)
+        if benchmark is not None:
+            nr_threads = int(threads.group(1)) if threads else 1
+            runtime = benchmark_profiles.runtime(benchmark.group(1), nr_threads)
+            if runtime is not None:
+                return [sys.executable, "-c", BURN_SCRIPT, str(runtime * TIME_SCALE), str(nr_threads)], cpus
+            logger.warning(f"[local] No measured runtime for {benchmark.group(1)}, it will idle until deleted")
+        return [sys.executable, "-c", IDLE_SCRIPT], cpus
+
+    def _start_pod(self, name: str, pod_spec: dict, labels: dict, job: Optional[str] = None) -> LocalPod:
+        node = self._select_node(pod_spec)
+        container = pod_spec["containers"][0]
+        argv, cpus = self._workload(container, node)
+
+        def pin():
+            if hasattr(os, "sched_setaffinity"):
+                os.sched_setaffinity(0, cpus)
+
+        process = subprocess.Popen(
+            argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, preexec_fn=pin, start_new_session=True
+        )
+        pod = LocalPod(
+            name,
+            container=container.get("name", name),
+            node=node,
+            ip=f"100.96.{list(self.nodes).index(node.name)}.{self._next()}",
+            labels=labels,
+            process=process,
+            job=job,
+        )
+        logger.info(f"[local] Started {name} on {node.name} (CPUs {cpus})")
+
+        with self._condition:
+            self.pods[name] = pod
+            if job is not None:
+                self.jobs.setdefault(job, []).append(name)
+            self._condition.notify_all()
+
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap, name="local-cluster-reaper", daemon=True)
+            self._reaper.start()
+        return pod
+
+    def _kill(self, pod: LocalPod) -> None:
+        if pod.process.poll() is None:
+            pod.process.kill()
+        pod.process.wait()
+
+    def create(self, documents: list[dict]) -> subprocess.CompletedProcess[bytes]:
+        created = []
+        for document in documents:
+            metadata = document["metadata"]
+            if metadata["name"] in self.pods or metadata["name"] in self.jobs:
+                created.append(f"{document['kind'].lower()}/{metadata['name']} unchanged")
+            elif document["kind"] == "Pod":
+                self._start_pod(metadata["name"], document["spec"], metadata.get("labels", {}))
+                created.append(f"pod/{metadata['name']} created")
+            elif document["kind"] == "Job":
+                pod_name = f"{metadata['name']}-{self._next():05d}"
+                template = document["spec"]["template"]
+                # Like the job controller, label the pod with the name of its job
+                labels = {**template.get("metadata", {}).get("labels", {}), "job-name": metadata["name"]}
+                self._start_pod(pod_name, template["spec"], labels, job=metadata["name"])
+                created.append(f"job.batch/{metadata['name']} created")
+            else:
+                return _error(f"kind {document['kind']} is not supported by the local backend")
+        return _ok("\n".join(created))
+
+    def delete(self, kind: str, name: Optional[str]) -> subprocess.CompletedProcess[bytes]:
+        kind = kind.rstrip("s")
+        with self._condition:
+            if kind == "job":
+                names = list(self.jobs) if name is None else [name]
+                pods = [self.pods.pop(pod, None) for job in names for pod in self.jobs.pop(job, [])]
+            elif kind == "pod":
+                pods = [self.pods.pop(pod) for pod in (list(self.pods) if name is None else [name]) if pod in self.pods]
+            elif kind in ("service", "svc"):
+                for service in list(self.services) if name is None else [name]:
+                    self.services.pop(service, None)
+                pods = []
+            else:
+                return _error(f"kind {kind} is not supported by the local backend")
+            self._condition.notify_all()
+
+        for pod in pods:
+            if pod is not None:
+                self._kill(pod)
+        return _ok(f"{kind} deleted")
+
+    def expose(self, pod_name: str, service_name: str, service_type: str, port: int, protocol: str):
+        with self._condition:
+            number = len(self.services) + 1
+            self.services[service_name] = LocalService(
+                service_name,
+                type=service_type,
+                cluster_ip=f"100.64.0.{number + 10}",
+                external_ip=f"198.51.100.{number}",
+                ports=[{"port": port, "protocol": protocol}],
+            )
+            self._condition.notify_all()
+        return _ok(f"service/{service_name} exposed")
+
+    def teardown(self) -> None:
+        with self._condition:
+            pods = list(self.pods.values())
+            self.pods.clear()
+            self.jobs.clear()
+            self.services.clear()
+            self.nodes = {}
+            self._condition.notify_all()
+        for pod in pods:
+            self._kill(pod)
+
+    # Commands
+
+    def _documents(self, manifest_file: str, input: Optional[bytes]) -> list[dict]:
+        if manifest_file == "-":
+            content = (input or b"").decode("utf-8")
+        else:
+            with open(manifest_file) as f:
+                content = f.read()
+        return [document for document in yaml.safe_load_all(content) if document is not None]
+
+    def _kubectl(self, args: list[str], input: Optional[bytes]) -> subprocess.CompletedProcess[bytes]:
+        options = {args[i]: args[i + 1] for i in range(len(args) - 1) if args[i].startswith("-")}
+        positional = [
+            arg for i, arg in enumerate(args) if not arg.startswith("-") and (i == 0 or not args[i - 1].startswith("-"))
+        ]
+        subcommand = positional[0] if positional else ""
+
+        if subcommand in ("create", "apply") and "-f" in options:
+            return self.create(self._documents(options["-f"], input))
+        if subcommand == "delete":
+            if "-f" in options:
+                for document in self._documents(options["-f"], input):
+                    self.delete(document["kind"].lower(), document["metadata"]["name"])
+                return _ok()
+            name = None if "--all" in args else (positional[2] if len(positional) > 2 else None)
+            return self.delete(positional[1], name)
+        if subcommand == "expose":
+            return self.expose(
+                positional[2],
+                options.get("--name", positional[2]),
+                options.get("--type", "ClusterIP"),
+                int(options.get("--port", "0")),
+                options.get("--protocol", "TCP"),
+            )
+        if subcommand == "label":
+            return _ok()
+        if subcommand == "get":
+            resource_type = positional[1] if positional[1].endswith("s") else f"{positional[1]}s"
+            if options.get("-o") == "json":
+                with self._condition:
+                    if resource_type == "pods":
+                        items = [pod.to_json() for pod in self.pods.values()]
+                    elif resource_type == "nodes":
+                        items = [node.to_json() for node in self.nodes.values()]
+                    elif resource_type == "services":
+                        items = [service.to_json() for service in self.services.values()]
+                    else:
+                        items = [self._job_json(name) for name in self.jobs]
+                return _ok(json.dumps({"items": items}, indent=2))
+            rows = [record.row() for record in self._records(resource_type)]
+            return _ok("\n".join("   ".join(row) for row in rows))
+        return _error(f"kubectl {' '.join(args)} is not supported by the local backend")
+
+    def _kops(self, args: list[str]) -> subprocess.CompletedProcess[bytes]:
+        if args[:1] == ["create"] and "-f" in args:
+            self.load_cluster(args[args.index("-f") + 1])
+        elif args[:2] == ["delete", "cluster"]:
+            self.teardown()
+        elif args[:2] == ["get", "clusters"]:
+            clusters = [{"metadata": {"name": self.cluster_name}}] if self.nodes else []
+            return _ok(json.dumps(clusters))
+        return _ok()
+
+    def run(self, command: list[str], input: Optional[bytes] = None) -> subprocess.CompletedProcess[bytes]:
+        if command[0] == "kubectl":
+            res = self._kubectl(command[1:], input)
+        elif command[0] == "kops":
+            res = self._kops(command[1:])
+        else:
+            # gsutil, gcloud: there is nothing to create or delete locally
+            res = _ok()
+        res.args = command
+        return res
+
+    def _node_env(self, node: str) -> list[str]:
+        if node not in self.nodes:
+            raise ValueError(f"Unknown node {node}")
+        return ["env", f"HOME={self.nodes[node].home}", f"PATH={SHIM_DIR}:{os.environ.get('PATH', '')}"]
+
+    def node_argv(self, node: str, command: str) -> list[str]:
+        return [*self._node_env(node), "sh", "-c", f"cd ~ && {command}"]
+
+    def copy_argv(self, node: str, source_path: str, destination_path: str, to_node: bool) -> list[str]:
+        # `~` is left unquoted so that it expands to the node's home directory
+        if to_node:
+            copy_command = f"cp {shlex.quote(source_path)} {destination_path}"
+        else:
+            copy_command = f"cp {source_path} {shlex.quote(os.path.abspath(destination_path))}"
+        return [*self._node_env(node), "sh", "-c", copy_command]
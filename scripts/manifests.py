@@ -0,0 +1,109 @@
+"""
+In-memory rendering of the benchmark manifests.
+
+Every base manifest is parsed once. Rendering applies typed overrides (node selector, cpuset, number of threads,
+image, benchmark suite and benchmark) to a copy of it, and the result is piped straight into `kubectl apply -f -`, so
+neither temporary files are written nor the checked-in manifests modified.
+"""
+
+import copy
+import functools
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+import yaml
+
+from scripts.utils import run_command
+
+
+NODE_TYPE_LABEL = "cca-project-nodetype"
+
+
+@dataclass(frozen=True)
+class Overrides:
+    node_selector: Optional[str] = None
+    # Cores the benchmark is pinned to with `taskset -c`, e.g. "0,1"
+    cpuset: Optional[str] = None
+    nr_threads: Optional[int] = None
+    image: Optional[str] = None
+    image_pull_policy: Optional[str] = None
+    benchmark_suite: Optional[str] = None
+    benchmark: Optional[str] = None
+
+
+def _set_option(command: str, option: str, value: str) -> str:
+    # Replaces the value of `option` in a `./run ...` command line, e.g. `-n 1` -> `-n 4`
+    pattern = re.compile(rf"(^|\s){re.escape(option)}\s+\S+")
+    if pattern.search(command) is None:
+        return f"{command} {option} {value}"
+    return pattern.sub(lambda match: f"{match.group(1)}{option} {value}", command, count=1)
+
+
+def _set_cpuset(command: str, cpuset: str) -> str:
+    taskset = re.compile(r"^taskset -c \S+ ")
+    if taskset.match(command):
+        return taskset.sub(f"taskset -c {cpuset} ", command, count=1)
+    return f"taskset -c {cpuset} {command}"
+
+
+def _pod_spec(manifest: dict) -> dict:
+    return manifest["spec"]["template"]["spec"] if manifest["kind"] == "Job" else manifest["spec"]
+
+
+class ManifestTemplate:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path) as f:
+            self.manifest = yaml.safe_load(f)
+
+    @property
+    def name(self) -> str:
+        return self.manifest["metadata"]["name"]
+
+    @property
+    def image(self) -> str:
+        return _pod_spec(self.manifest)["containers"][0]["image"]
+
+    def render(self, overrides: Overrides = Overrides()) -> dict:
+        manifest = copy.deepcopy(self.manifest)
+        pod_spec = _pod_spec(manifest)
+        container = pod_spec["containers"][0]
+
+        if overrides.node_selector is not None:
+            pod_spec.setdefault("nodeSelector", {})[NODE_TYPE_LABEL] = overrides.node_selector
+        if overrides.image is not None:
+            container["image"] = overrides.image
+        if overrides.image_pull_policy is not None:
+            container["imagePullPolicy"] = overrides.image_pull_policy
+
+        # args: ["-c", "taskset -c 4,5,6 ./run -a run -S parsec -p canneal -i native -n 3"]
+        command = container["args"][-1]
+        if overrides.cpuset is not None:
+            command = _set_cpuset(command, overrides.cpuset)
+        if overrides.benchmark_suite is not None:
+            command = _set_option(command, "-S", overrides.benchmark_suite)
+        if overrides.benchmark is not None:
+            command = _set_option(command, "-p", overrides.benchmark)
+        if overrides.nr_threads is not None:
+            command = _set_option(command, "-n", str(overrides.nr_threads))
+        container["args"][-1] = command
+        return manifest
+
+    def to_yaml(self, overrides: Overrides = Overrides()) -> str:
+        return yaml.safe_dump(self.render(overrides), default_flow_style=False)
+
+
+@functools.lru_cache(maxsize=None)
+def load_template(path: str) -> ManifestTemplate:
+    return ManifestTemplate(path)
+
+
+def apply_manifest(manifest: dict):
+    """Creates (or updates) the object by piping the manifest into `kubectl apply -f -`."""
+    return apply_manifests([manifest])
+
+
+def apply_manifests(manifests: list[dict]):
+    """Creates (or updates) all objects with a single `kubectl apply` of a multi-document manifest."""
+    return run_command(["kubectl", "apply", "-f", "-"], input=yaml.safe_dump_all(manifests).encode("utf-8"))
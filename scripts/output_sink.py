@@ -0,0 +1,151 @@
+"""
+Bounded-memory sinks for the output of (remote) processes.
+
+A sink reads a process' stdout line by line on a background thread and writes every line to its file as soon as it
+arrives, together with the time it was received (in a `<file>.ts` sidecar, so the output file itself stays parseable
+by the plotting scripts). Only the last `tail_lines` lines are kept in memory, files are rotated once they exceed
+`max_bytes`, and every open sink is flushed and closed at interpreter exit.
+"""
+
+import atexit
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from typing import IO, Callable, Optional
+
+from loguru import logger
+
+
+DEFAULT_TAIL_LINES = 200
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 3
+
+_open_sinks: set["OutputSink"] = set()
+_open_sinks_lock = threading.Lock()
+
+
+class OutputSink:
+    def __init__(
+        self,
+        path: str,
+        tail_lines: int = DEFAULT_TAIL_LINES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        backup_count: int = DEFAULT_BACKUP_COUNT,
+        timestamps: bool = True,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.timestamps = timestamps
+
+        self.tail: deque[tuple[datetime, str]] = deque(maxlen=tail_lines)
+        self.lines_written = 0
+        self.closed = False
+
+        self._lock = threading.Lock()
+        self._reader: Optional[threading.Thread] = None
+        self._open_files()
+
+        with _open_sinks_lock:
+            _open_sinks.add(self)
+
+    def _open_files(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "w")
+        self._ts_file = open(f"{self.path}.ts", "w") if self.timestamps else None
+        self._bytes_written = 0
+
+    def _rotate(self) -> None:
+        self._close_files()
+        for suffix in ["", ".ts"]:
+            for i in range(self.backup_count - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{i}{suffix}"):
+                    os.replace(f"{self.path}.{i}{suffix}", f"{self.path}.{i + 1}{suffix}")
+            if os.path.exists(f"{self.path}{suffix}"):
+                os.replace(f"{self.path}{suffix}", f"{self.path}.1{suffix}")
+        self._open_files()
+
+    def _close_files(self) -> None:
+        for f in [self._file, self._ts_file]:
+            if f is not None:
+                f.flush()
+                f.close()
+
+    def write_line(self, line: str) -> None:
+        received = datetime.now()
+        with self._lock:
+            if self.closed:
+                return
+            if self._bytes_written > self.max_bytes:
+                self._rotate()
+
+            self._file.write(line + "\n")
+            self._file.flush()
+            if self._ts_file is not None:
+                self._ts_file.write(f"{received.isoformat()} {self.lines_written}\n")
+                self._ts_file.flush()
+
+            self._bytes_written += len(line) + 1
+            self.lines_written += 1
+            self.tail.append((received, line))
+
+    def _read(self, stream: IO[bytes], line_filter: Optional[Callable[[str], bool]]) -> None:
+        try:
+            for raw_line in iter(stream.readline, b""):
+                line = raw_line.decode("utf-8", errors="replace").rstrip("\n")
+                if line_filter is None or line_filter(line):
+                    self.write_line(line)
+        except ValueError:
+            # The stream was closed underneath us (e.g. the process was killed)
+            pass
+        finally:
+            stream.close()
+
+    def attach(self, stream: IO[bytes], line_filter: Optional[Callable[[str], bool]] = None) -> None:
+        """
+        Starts copying `stream` (e.g. `Popen.stdout`) into the sink until it reaches EOF. Lines for which
+        `line_filter` returns False are not written.
+        """
+        self._reader = threading.Thread(
+            target=self._read, args=(stream, line_filter), name=f"sink-{self.path}", daemon=True
+        )
+        self._reader.start()
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Waits until the attached stream reached EOF."""
+        if self._reader is not None:
+            self._reader.join(timeout)
+
+    def tail_text(self) -> str:
+        with self._lock:
+            return "\n".join(line for _, line in self.tail)
+
+    def close(self, timeout: float = 5) -> None:
+        # Give the reader a moment to drain what the process wrote right before it exited
+        self.wait(timeout)
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self._close_files()
+        with _open_sinks_lock:
+            _open_sinks.discard(self)
+
+    def __enter__(self) -> "OutputSink":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"<OutputSink: {self.path}>"
+
+
+@atexit.register
+def close_all_sinks() -> None:
+    with _open_sinks_lock:
+        sinks = list(_open_sinks)
+    for sink in sinks:
+        logger.info(f"Closing {sink} ({sink.lines_written} lines)")
+        sink.close(timeout=1)
@@ -0,0 +1,200 @@
+"""
+Placement of the part 3 batch jobs that minimizes the predicted makespan.
+
+The cores of every batch node (except the ones memcached is pinned to) are split into groups. Each group runs a chain
+of jobs one after the other, every job with as many threads as the group has cores, so the makespan is the longest
+chain. The runtime of a job is predicted from the part 2b scaling measurements, slowed down by the node's relative
+core speed and, if other groups run on the same node at the same time, by the job's part 2a sensitivity to the
+interference its neighbours cause (shared last-level cache and memory bandwidth).
+
+The search goes over all ways to split every node into groups and assigns the jobs to groups with a branch and bound
+search, longest jobs first.
+"""
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+from loguru import logger
+
+from scripts.benchmark_profiles import RuntimeModel
+from scripts.job import PARSEC_PATH, Job
+from scripts.manifests import NODE_TYPE_LABEL, load_template
+
+
+MEMCACHED_MANIFEST = "memcache-t1-cpuset-part3.yaml"
+
+# Node type -> number of cores
+BATCH_NODES = {
+    "node-a-2core": 2,
+    "node-b-4core": 4,
+    "node-c-8core": 8,
+}
+
+BENCHMARK_SUITES = {"radix": "splash2x"}
+
+
+@dataclass
+class Chain:
+    node: str
+    cores: list[int]
+    # Benchmarks in the order they run, with their predicted runtimes
+    benchmarks: list[str] = field(default_factory=list)
+    runtimes: list[float] = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        return sum(self.runtimes)
+
+
+@dataclass
+class Placement:
+    chains: list[Chain]
+
+    @property
+    def makespan(self) -> float:
+        return max(chain.duration for chain in self.chains)
+
+    def jobs(self) -> list[Job]:
+        """One Job per benchmark, each depending on the previous job of its chain."""
+        jobs = []
+        for chain in self.chains:
+            previous: Optional[Job] = None
+            for benchmark in chain.benchmarks:
+                job = Job(
+                    benchmark,
+                    benchmark,
+                    chain.node,
+                    ",".join(str(core) for core in chain.cores),
+                    len(chain.cores),
+                    benchmark_suite=BENCHMARK_SUITES.get(benchmark, "parsec"),
+                    depends_on=[previous] if previous is not None else [],
+                )
+                jobs.append(job)
+                previous = job
+        return jobs
+
+    def describe(self) -> str:
+        lines = [f"Predicted makespan: {self.makespan:.1f}s"]
+        for chain in self.chains:
+            if len(chain.benchmarks) > 0:
+                steps = " -> ".join(f"{b} ({t:.1f}s)" for b, t in zip(chain.benchmarks, chain.runtimes))
+                lines.append(f"  {chain.node} cores {chain.cores}: {steps}")
+        return "\n".join(lines)
+
+
+def benchmarks() -> list[str]:
+    # yaml_files_part3/parsec-<benchmark>.yaml
+    return sorted(
+        name.removeprefix("parsec-").removesuffix(".yaml")
+        for name in os.listdir(PARSEC_PATH)
+        if name.startswith("parsec-") and name.endswith(".yaml")
+    )
+
+
+def memcached_cores(manifest_file: str = MEMCACHED_MANIFEST) -> tuple[str, set[int]]:
+    """Node type and cores memcached is pinned to, read from its manifest."""
+    template = load_template(manifest_file)
+    pod_spec = template.manifest["spec"]
+    node = pod_spec.get("nodeSelector", {}).get(NODE_TYPE_LABEL, "")
+    match = re.match(r"^taskset -c (\S+) ", pod_spec["containers"][0]["args"][-1])
+    if match is None:
+        return node, set()
+    return node, {int(core) for core in match.group(1).split(",")}
+
+
+def free_cores() -> dict[str, list[int]]:
+    memcached_node, reserved = memcached_cores()
+    return {
+        node: [core for core in range(nr_cores) if node != memcached_node or core not in reserved]
+        for node, nr_cores in BATCH_NODES.items()
+    }
+
+
+def _partitions(n: int, largest: Optional[int] = None) -> list[list[int]]:
+    # Ways to write n as a sum of group sizes, in decreasing order: 3 -> [3], [2, 1], [1, 1, 1]
+    if n == 0:
+        return [[]]
+    largest = n if largest is None else largest
+    return [[size] + rest for size in range(min(n, largest), 0, -1) for rest in _partitions(n - size, size)]
+
+
+def _assign(
+    groups: list[tuple[str, int, bool]], jobs: list[str], predictor: RuntimeModel, bound: float
+) -> Optional[tuple[float, list[int]]]:
+    """Best assignment of jobs to groups with a makespan below `bound`: (makespan, group index of every job)."""
+    loads = [0.0] * len(groups)
+    assignment = [0] * len(jobs)
+    best: Optional[tuple[float, list[int]]] = None
+
+    def search(i: int) -> None:
+        nonlocal best, bound
+        if i == len(jobs):
+            makespan = max(loads)
+            if makespan < bound:
+                bound = makespan
+                best = (makespan, list(assignment))
+            return
+        tried = set()
+        for g, (node, nr_cores, shared) in enumerate(groups):
+            # Groups of the same size on the same node with the same load are interchangeable
+            if (node, nr_cores, loads[g]) in tried:
+                continue
+            tried.add((node, nr_cores, loads[g]))
+            duration = predictor.predict(jobs[i], node, nr_cores, shared)
+            if loads[g] + duration >= bound:
+                continue
+            loads[g] += duration
+            assignment[i] = g
+            search(i + 1)
+            loads[g] -= duration
+
+    search(0)
+    return best
+
+
+def optimize_placement(jobs: Optional[list[str]] = None) -> Placement:
+    jobs = benchmarks() if jobs is None else jobs
+    predictor = RuntimeModel()
+    cores = free_cores()
+
+    # Longest jobs first, so that the bound prunes early
+    jobs = sorted(jobs, key=lambda b: predictor.predict(b, "node-a-2core", 1, False), reverse=True)
+
+    splits: list[list[tuple[str, list[int]]]] = [[]]
+    for node, node_cores in cores.items():
+        node_splits = []
+        for sizes in _partitions(len(node_cores)):
+            offsets = [sum(sizes[:i]) for i in range(len(sizes))]
+            node_splits.append([(node, node_cores[o : o + s]) for o, s in zip(offsets, sizes)])
+        splits = [split + node_split for split in splits for node_split in node_splits]
+
+    best: Optional[Placement] = None
+    bound = float("inf")
+    for split in splits:
+        groups_per_node = {node: len([g for g in split if g[0] == node]) for node in cores}
+        groups = [(node, len(group_cores), groups_per_node[node] > 1) for node, group_cores in split]
+        result = _assign(groups, jobs, predictor, bound)
+        if result is None:
+            continue
+        bound, assignment = result
+        chains = [Chain(node, group_cores) for node, group_cores in split]
+        for benchmark, g in zip(jobs, assignment):
+            node, nr_cores, shared = groups[g]
+            chains[g].benchmarks.append(benchmark)
+            chains[g].runtimes.append(predictor.predict(benchmark, node, nr_cores, shared))
+        best = Placement([chain for chain in chains if len(chain.benchmarks) > 0])
+
+    if best is None:
+        raise ValueError("No placement found")
+    logger.info(best.describe())
+    return best
+
+
+def optimized_jobs() -> list[Job]:
+    return optimize_placement().jobs()
+
+
+if __name__ == "__main__":
+    optimize_placement()
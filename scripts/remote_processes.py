@@ -0,0 +1,149 @@
+"""
+Registry of the long-running processes we start on the nodes (mcperf agents/measurements, the CPU sampler, ...).
+
+Every command is started in its own process group on the node, whose id the remote shell reports as the first line
+of output. Tearing down kills the whole group remotely (TERM, then KILL after a grace period) and then reaps the local
+ssh/gcloud wrapper, so no stale agent keeps burning CPU on the client nodes and skews the next run. Teardown runs on
+normal exit, on exceptions and on SIGINT/SIGTERM.
+"""
+
+import atexit
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from loguru import logger
+
+from scripts.output_sink import OutputSink
+from scripts.utils import build_ssh_command, env, ssh_command
+
+
+PGID_MARKER = "__CCA_REMOTE_PGID__="
+
+# Seconds between TERM and KILL when tearing down a process group
+TERMINATE_GRACE_PERIOD = 3
+
+
+@dataclass
+class RemoteProcess:
+    node: str
+    command: str
+    local: subprocess.Popen
+    sink: OutputSink
+    started_at: datetime = field(default_factory=datetime.now)
+    pgid: Optional[int] = None
+
+    def __repr__(self) -> str:
+        return f"<RemoteProcess: {self.node} pgid={self.pgid} '{self.command}'>"
+
+
+class RemoteProcessRegistry:
+    def __init__(self):
+        self.processes: list[RemoteProcess] = []
+        self._lock = threading.Lock()
+        self._pgid_received = threading.Condition(self._lock)
+
+    def launch(self, node: str, command: str, sink: OutputSink) -> RemoteProcess:
+        # setsid puts the command into a new process group, the inner shell's pid is that group's id
+        wrapped_command = f"setsid sh -c {shlex.quote(f'echo {PGID_MARKER}$$; {command}')}"
+        argv, _ = build_ssh_command(node, wrapped_command, env)
+        logger.info(f"\n(Registered) SSH Command on node {node}: {command}")
+
+        local = subprocess.Popen(argv, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        process = RemoteProcess(node=node, command=command, local=local, sink=sink)
+        with self._lock:
+            self.processes.append(process)
+
+        def capture_pgid(line: str) -> bool:
+            if process.pgid is None and line.startswith(PGID_MARKER):
+                with self._lock:
+                    process.pgid = int(line[len(PGID_MARKER) :])
+                    self._pgid_received.notify_all()
+                return False
+            return True
+
+        sink.attach(local.stdout, line_filter=capture_pgid)  # type: ignore
+        return process
+
+    def _await_pgids(self, processes: list[RemoteProcess], timeout: float) -> None:
+        # A process that was launched right before teardown may not have reported its group yet
+        with self._lock:
+            self._pgid_received.wait_for(
+                lambda: all(p.pgid is not None or p.local.poll() is not None for p in processes), timeout=timeout
+            )
+
+    def _terminate_on_node(self, node: str, pgids: list[int]) -> list[int]:
+        groups = " ".join(str(pgid) for pgid in pgids)
+        teardown_command = (
+            f"for g in {groups}; do sudo kill -TERM -- -$g 2>/dev/null; done; sleep {TERMINATE_GRACE_PERIOD}; "
+            f"for g in {groups}; do pgrep -g $g >/dev/null && sudo kill -KILL -- -$g; done; sleep 1; "
+            f"for g in {groups}; do pgrep -g $g >/dev/null && echo leftover $g; done; true"
+        )
+        res = ssh_command(node, teardown_command)
+        output = res.stdout.decode("utf-8")  # type: ignore
+        return [int(line.split()[1]) for line in output.splitlines() if line.startswith("leftover")]
+
+    def terminate_all(self) -> list[RemoteProcess]:
+        """Terminates every registered process and returns the ones that could not be killed on their node."""
+        with self._lock:
+            processes = list(self.processes)
+            self.processes.clear()
+        if len(processes) == 0:
+            return []
+
+        self._await_pgids(processes, timeout=5)
+
+        by_node: dict[str, list[RemoteProcess]] = {}
+        for process in processes:
+            if process.pgid is None:
+                logger.warning(f"{process} never reported its process group, only the local wrapper is killed")
+                continue
+            by_node.setdefault(process.node, []).append(process)
+
+        leftovers: list[RemoteProcess] = []
+        threads = []
+        for node, node_processes in by_node.items():
+
+            def terminate(node=node, node_processes=node_processes):
+                leftover_pgids = self._terminate_on_node(node, [p.pgid for p in node_processes])  # type: ignore
+                leftovers.extend(p for p in node_processes if p.pgid in leftover_pgids)
+
+            thread = threading.Thread(target=terminate)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        for process in processes:
+            if process.local.poll() is None:
+                process.local.kill()
+            process.local.wait()
+            process.sink.close(timeout=1)
+            runtime = (datetime.now() - process.started_at).total_seconds()
+            logger.info(f"Terminated {process} after {runtime:.0f}s")
+
+        for process in leftovers:
+            logger.error(f"Could not terminate {process}, it is still running")
+        return leftovers
+
+
+REMOTE_PROCESSES = RemoteProcessRegistry()
+
+
+@atexit.register
+def _terminate_remote_processes() -> None:
+    REMOTE_PROCESSES.terminate_all()
+
+
+def _handle_termination(signum, frame) -> None:
+    # Unwind through the callers' finally blocks and the atexit hook above, just like on KeyboardInterrupt
+    logger.warning(f"Received signal {signum}, terminating remote processes")
+    sys.exit(128 + signum)
+
+
+signal.signal(signal.SIGTERM, _handle_termination)
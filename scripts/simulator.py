@@ -0,0 +1,119 @@
+"""
+Offline discrete-event simulation of a part 3 schedule.
+
+A schedule is the Job list task3 would run (node, cores, number of threads, dependencies). Jobs start as soon as their
+dependencies have finished. Between two events (a job starting or finishing) every running job progresses at a
+constant rate:
+- alone on its node, a job takes the runtime predicted by `RuntimeModel` for its benchmark, node and thread count;
+- jobs sharing a core get an equal part of it (more threads than cores count as sharing as well);
+- while other jobs run on the same node, the job is slowed down by its part 2a colocation sensitivity.
+The simulation yields the predicted start and end of every job and the makespan, in milliseconds, without a cluster.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+from loguru import logger
+
+from scripts.benchmark_profiles import RuntimeModel
+from scripts.job import Job
+from scripts.job_graph import JobGraph
+
+
+# Remaining work (in seconds at full speed) below which a job counts as finished, to absorb rounding errors
+EPSILON = 1e-9
+
+
+@dataclass
+class SimulatedJob:
+    job_name: str
+    node: str
+    start_ms: float
+    end_ms: float
+
+    @property
+    def duration_ms(self) -> float:
+        return self.end_ms - self.start_ms
+
+
+@dataclass
+class Simulation:
+    jobs: dict[str, SimulatedJob]
+
+    @property
+    def makespan_ms(self) -> float:
+        if len(self.jobs) == 0:
+            return 0.0
+        return max(job.end_ms for job in self.jobs.values()) - min(job.start_ms for job in self.jobs.values())
+
+    def describe(self) -> str:
+        lines = [f"Predicted makespan: {self.makespan_ms:.0f}ms"]
+        for job in sorted(self.jobs.values(), key=lambda j: j.start_ms):
+            lines.append(f"  {job.job_name:<14} {job.node:<14} {job.start_ms:>10.0f}ms -> {job.end_ms:>10.0f}ms")
+        return "\n".join(lines)
+
+
+def parse_cores(cores: str) -> list[int]:
+    # "0,1,4-6" -> [0, 1, 4, 5, 6]
+    result = []
+    for part in cores.split(","):
+        first, _, last = part.partition("-")
+        result.extend(range(int(first), int(last or first) + 1))
+    return result
+
+
+def simulate(jobs: list[Job], model: Optional[RuntimeModel] = None) -> Simulation:
+    model = RuntimeModel() if model is None else model
+    # Includes the dependencies and raises DependencyCycle if the schedule can never finish
+    jobs = JobGraph(jobs).jobs
+
+    cores = {job: parse_cores(job.cores) for job in jobs}
+    # Work of a job in seconds at full speed, i.e. its runtime when it has its node to itself
+    remaining = {job: model.alone(job.benchmark, job.node_selector, job.nr_threads) for job in jobs}
+    started: dict[Job, float] = {}
+    finished: dict[Job, float] = {}
+    now = 0.0
+
+    def release() -> None:
+        for job in jobs:
+            if job not in started and all(dependency in finished for dependency in job.depends_on):
+                started[job] = now
+
+    def rate(job: Job, running: list[Job]) -> float:
+        on_node = [other for other in running if other.node_selector == job.node_selector]
+        # Threads per core on the most loaded of the job's cores
+        threads_per_core = {other: other.nr_threads / len(cores[other]) for other in on_node}
+        load = max(sum(threads_per_core[other] for other in on_node if core in cores[other]) for core in cores[job])
+        share = min(1.0, 1.0 / load)
+        return share / (model.colocation_slowdown(job.benchmark) if len(on_node) > 1 else 1.0)
+
+    release()
+    while len(finished) < len(jobs):
+        running = [job for job in started if job not in finished]
+        rates = {job: rate(job, running) for job in running}
+        step = min(remaining[job] / rates[job] for job in running)
+        now += step
+        for job in running:
+            remaining[job] -= step * rates[job]
+            if remaining[job] <= EPSILON:
+                finished[job] = now
+        release()
+
+    return Simulation(
+        {
+            job.job_name: SimulatedJob(job.job_name, job.node_selector, started[job] * 1000, finished[job] * 1000)
+            for job in jobs
+        }
+    )
+
+
+def rank(schedules: list[list[Job]], model: Optional[RuntimeModel] = None) -> list[tuple[float, int]]:
+    """(Predicted makespan in ms, index) of every schedule, shortest first."""
+    model = RuntimeModel() if model is None else model
+    return sorted((simulate(jobs, model).makespan_ms, i) for i, jobs in enumerate(schedules))
+
+
+if __name__ == "__main__":
+    from scripts.placement import optimized_jobs
+
+    logger.info(simulate(optimized_jobs()).describe())
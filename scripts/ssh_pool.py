@@ -0,0 +1,200 @@
+"""
+Persistent, multiplexed SSH sessions to the cluster nodes.
+
+`gcloud compute ssh` re-resolves the instance, re-checks the keys and performs a full SSH handshake on every call.
+The pool resolves the plain `ssh` invocation for a node once (through `gcloud compute ssh --dry-run`) and keeps an
+OpenSSH master connection open per node. Every later command or copy only opens a new channel on that master.
+
+Set CCA_SSH_POOL=0 to fall back to plain `gcloud compute ssh/scp` (e.g. to compare the timing reports).
+"""
+
+import os
+import shlex
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from loguru import logger
+
+
+SSH_KEY_FILE = os.path.expanduser("~/.ssh/cloud-computing")
+
+# Unix socket paths are limited to ~100 characters, so we keep them short and let ssh hash the rest (%C)
+CONTROL_DIR = os.path.join(tempfile.gettempdir(), "cca-ssh")
+
+# A master connection is closed after being idle for this many seconds
+IDLE_TIMEOUT = 600
+# A master connection that was not used for this many seconds is checked before it is reused
+HEALTH_CHECK_INTERVAL = 30
+
+
+class SSHSession:
+    def __init__(self, node: str, destination: str, options: list[str]):
+        self.node = node
+        self.destination = destination
+        self.options = options
+        self.control_path = os.path.join(CONTROL_DIR, "%C")
+        self.last_used = time.monotonic()
+
+    @property
+    def control_options(self) -> list[str]:
+        return ["-o", "ControlMaster=no", "-o", f"ControlPath={self.control_path}"]
+
+    def open(self) -> bool:
+        # -M: master mode, -N: no command, -f: go to the background once authenticated
+        master_command = [
+            "ssh",
+            *self.options,
+            "-M",
+            "-N",
+            "-f",
+            "-o",
+            f"ControlPath={self.control_path}",
+            "-o",
+            f"ControlPersist={IDLE_TIMEOUT}s",
+            self.destination,
+        ]
+        # The backgrounded master inherits our file descriptors, so we must not capture its output
+        res = subprocess.run(
+            master_command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        self.last_used = time.monotonic()
+        return res.returncode == 0
+
+    def is_alive(self) -> bool:
+        check_command = ["ssh", "-o", f"ControlPath={self.control_path}", "-O", "check", self.destination]
+        return subprocess.run(check_command, capture_output=True).returncode == 0
+
+    def close(self) -> None:
+        exit_command = ["ssh", "-o", f"ControlPath={self.control_path}", "-O", "exit", self.destination]
+        subprocess.run(exit_command, capture_output=True)
+
+    def ssh_argv(self, command: str) -> list[str]:
+        self.last_used = time.monotonic()
+        return ["ssh", *self.options, *self.control_options, self.destination, "--", command]
+
+    def scp_to_argv(self, source_path: str, destination_path: str) -> list[str]:
+        self.last_used = time.monotonic()
+        return ["scp", *self.options, *self.control_options, source_path, f"{self.destination}:{destination_path}"]
+
+    def scp_from_argv(self, source_path: str, destination_path: str) -> list[str]:
+        self.last_used = time.monotonic()
+        return ["scp", *self.options, *self.control_options, f"{self.destination}:{source_path}", destination_path]
+
+
+class SSHSessionPool:
+    def __init__(self, zone: str, user: str, key_file: str = SSH_KEY_FILE):
+        self.zone = zone
+        self.user = user
+        self.key_file = key_file
+        self.enabled = os.environ.get("CCA_SSH_POOL", "1") != "0"
+
+        self.sessions: dict[str, SSHSession] = {}
+        self.timings: dict[tuple[str, str], list[float]] = {}
+
+        self._lock = threading.Lock()
+        self._node_locks: dict[str, threading.Lock] = {}
+
+    def _node_lock(self, node: str) -> threading.Lock:
+        with self._lock:
+            return self._node_locks.setdefault(node, threading.Lock())
+
+    def _resolve(self, node: str) -> Optional[SSHSession]:
+        """
+        Ask gcloud for the plain ssh command it would run for this node, i.e. the resolved IP, key and known hosts
+        options. Returns None if gcloud cannot resolve the node.
+        """
+        dry_run_command = [
+            "gcloud",
+            "compute",
+            "ssh",
+            "--zone",
+            self.zone,
+            "--ssh-key-file",
+            self.key_file,
+            f"{self.user}@{node}",
+            "--dry-run",
+        ]
+        res = subprocess.run(dry_run_command, capture_output=True)
+        lines = [line for line in res.stdout.decode("utf-8").splitlines() if line.strip() != ""]
+        if res.returncode != 0 or len(lines) == 0:
+            logger.warning(f"Could not resolve ssh command for node {node}: {res.stderr.decode('utf-8')}")
+            return None
+
+        # Output: /usr/bin/ssh -t -i <key> -o <option> ... <user>@<ip>
+        argv = shlex.split(lines[-1])
+        options = [arg for arg in argv[1:-1] if arg not in ("-t", "-T")]
+        return SSHSession(node, destination=argv[-1], options=options)
+
+    def _evict_idle(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            idle = [node for node, session in self.sessions.items() if now - session.last_used > IDLE_TIMEOUT]
+            evicted = [self.sessions.pop(node) for node in idle]
+        for session in evicted:
+            logger.info(f"Closing idle SSH master connection to {session.node}")
+            session.close()
+
+    def acquire(self, node: str) -> Optional[SSHSession]:
+        """
+        Returns a session with an open master connection to the node, or None if the pool is disabled or the node
+        could not be resolved (callers then fall back to gcloud).
+        """
+        if not self.enabled:
+            return None
+
+        self._evict_idle()
+
+        with self._node_lock(node):
+            session = self.sessions.get(node)
+
+            if session is not None and time.monotonic() - session.last_used > HEALTH_CHECK_INTERVAL:
+                if not session.is_alive():
+                    logger.warning(f"SSH master connection to {node} is dead, reconnecting")
+                    session = None
+
+            if session is None:
+                start = time.monotonic()
+                session = self._resolve(node)
+                if session is None or not session.open():
+                    return None
+                self.record(node, "connect", time.monotonic() - start)
+                logger.info(f"Opened SSH master connection to {node} ({session.destination})")
+
+            with self._lock:
+                self.sessions[node] = session
+            return session
+
+    def close_all(self) -> None:
+        with self._lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def record(self, node: str, kind: str, seconds: float) -> None:
+        with self._lock:
+            self.timings.setdefault((node, kind), []).append(seconds)
+
+    def timing_report(self) -> str:
+        """
+        Per node and kind of operation: number of calls and their latency. Kinds are prefixed with `gcloud` when the
+        call did not go through a pooled session, so running once with CCA_SSH_POOL=0 and once without gives the
+        before/after comparison.
+        """
+        header = f"{'node':<40} {'kind':<14} {'count':>6} {'mean[s]':>8} {'p50[s]':>8} {'max[s]':>8} {'total[s]':>9}"
+        lines = [header]
+        with self._lock:
+            timings = sorted(self.timings.items())
+        for (node, kind), values in timings:
+            lines.append(
+                f"{node:<40} {kind:<14} {len(values):>6} {statistics.mean(values):>8.2f} "
+                f"{statistics.median(values):>8.2f} {max(values):>8.2f} {sum(values):>9.2f}"
+            )
+        return "\n".join(lines)
+
+
+os.makedirs(CONTROL_DIR, exist_ok=True)
@@ -8,7 +8,9 @@ from scripts.utils import (
     Part,
     start_cluster,
     run_command,
-    pods_ready,
+    is_memcached_ready,
+    wait_for_pods_ready,
+    wait_for_pods_deleted,
     get_node_info,
     get_pods_info,
     copy_file_to_node,
@@ -45,15 +47,14 @@ def task1(start: bool):
             res = subprocess.run(["kubectl", "create", "-f", os.path.join(PATH, file)], capture_output=True)
             check_output(res)
 
-            while not pods_ready():
-                time.sleep(10)
+            wait_for_pods_ready()
 
             print("Pod ready")
             run_tests(type, NUM_ITERATIONS, warmup=True)
 
-            # delete the pods and wait 10s to make sure the pod is deleted
+            # delete the pods and wait until the pod is gone
             subprocess.run(["kubectl", "delete", "pods", type])
-            time.sleep(10)
+            wait_for_pods_deleted(type)
 
 
 def run_tests(type: str, num_iterations: int, warmup: bool = True) -> None:
@@ -139,7 +140,7 @@ def launch_memcached() -> None:
     print("########### Starting Memcached ###########")
 
     # If Memcached is already running, we don't need to do anything
-    if pods_ready():
+    if is_memcached_ready():
         print("########### Memcached already running ###########")
         return
 
@@ -162,8 +163,7 @@ def launch_memcached() -> None:
     ]
     run_command(expose_memcached_command)
 
-    while not pods_ready():
-        time.sleep(10)
+    wait_for_pods_ready()
 
     print("########### Memcached started ###########")
 
@@ -9,9 +9,10 @@ from scripts.utils import (
     get_jobs_info,
     get_node_info,
     get_pods_info,
-    jobs_ready,
-    pods_ready,
     start_cluster,
+    wait_for_jobs_ready,
+    wait_for_pods_deleted,
+    wait_for_pods_ready,
 )
 
 
@@ -55,8 +56,7 @@ def run_tests(interference_path: str, parsec_path: str) -> None:
         )
 
         # Wait until the interference pod is started
-        while not pods_ready():
-            time.sleep(10)
+        wait_for_pods_ready()
 
         # Just making very sure the inference pod has started
         time.sleep(10)
@@ -66,8 +66,7 @@ def run_tests(interference_path: str, parsec_path: str) -> None:
                 ["kubectl", "create", "-f", os.path.join(parsec_path, parsec_file)], capture_output=True
             )
 
-            while not jobs_ready():
-                time.sleep(5)
+            wait_for_jobs_ready()
 
             # We need to get the name of the job to get the logs of it
 
@@ -101,8 +100,8 @@ def run_tests(interference_path: str, parsec_path: str) -> None:
 
             res = subprocess.run(["kubectl", "delete", "jobs", "--all"])
 
-            print("Deleted the job, sleeping for 10 seconds to make sure the pods are deleted")
-            time.sleep(10)
+            print("Deleted the job, waiting until its pods are deleted")
+            wait_for_pods_deleted(jobname)
 
         res = subprocess.run(["kubectl", "delete", "pods", "--all"])
 
@@ -111,8 +110,7 @@ def run_tests_no_interference(parsec_path: str) -> None:
     for parsec_file in os.listdir(parsec_path):
         res = subprocess.run(["kubectl", "create", "-f", os.path.join(parsec_path, parsec_file)], capture_output=True)
 
-        while not jobs_ready():
-            time.sleep(5)
+        wait_for_jobs_ready()
 
         jobname = ""
         for line in get_jobs_info():
@@ -144,8 +142,8 @@ def run_tests_no_interference(parsec_path: str) -> None:
 
         res = subprocess.run(["kubectl", "delete", "jobs", "--all"])
 
-        print("Deleted the job, sleeping for 10 seconds to make sure the pods are deleted")
-        time.sleep(10)
+        print("Deleted the job, waiting until its pods are deleted")
+        wait_for_pods_deleted(jobname)
 
 
 if __name__ == "__main__":
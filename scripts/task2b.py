@@ -1,10 +1,18 @@
 import os
 import subprocess
-import time
 import click
-import ruamel.yaml
 
-from scripts.utils import Part, check_output, get_jobs_info, get_node_info, get_pods_info, jobs_ready, start_cluster
+from scripts.manifests import Overrides, apply_manifest, load_template
+from scripts.utils import (
+    Part,
+    check_output,
+    get_jobs_info,
+    get_node_info,
+    get_pods_info,
+    start_cluster,
+    wait_for_jobs_ready,
+    wait_for_pods_deleted,
+)
 
 
 @click.command()
@@ -39,26 +47,11 @@ def run_tests(parsec_path: str, threads: list[int]) -> None:
     for num_threads in threads:
         for parsec_file in os.listdir(parsec_path):
 
-            yaml = ruamel.yaml.YAML()
-            yaml.preserve_quotes = True
-
-            with open(os.path.join(parsec_path, parsec_file)) as fp:
-                data = yaml.load(fp)
-
-            # Update the number of threads in the YAML file before starting it
-            data["spec"]["template"]["spec"]["containers"][0]["args"][1] = data["spec"]["template"]["spec"][
-                "containers"
-            ][0]["args"][1][:-1] + str(num_threads)
-
-            with open(os.path.join(parsec_path, parsec_file), "w") as f:
-                yaml.dump(data, f)
-
-            res = subprocess.run(
-                ["kubectl", "create", "-f", os.path.join(parsec_path, parsec_file)], capture_output=True
-            )
+            # The thread count is set on an in-memory copy, the checked-in manifest stays as it is
+            template = load_template(os.path.join(parsec_path, parsec_file))
+            apply_manifest(template.render(Overrides(nr_threads=num_threads)))
 
-            while not jobs_ready():
-                time.sleep(5)
+            wait_for_jobs_ready()
 
             jobname = ""
             for line in get_jobs_info():
@@ -90,6 +83,7 @@ def run_tests(parsec_path: str, threads: list[int]) -> None:
 
             res = subprocess.run(["kubectl", "delete", "jobs", "--all"])
             res = subprocess.run(["kubectl", "delete", "pods", "--all"])
+            wait_for_pods_deleted(jobname)
 
 
 if __name__ == "__main__":
@@ -3,29 +3,31 @@ import click
 import time
 import os
 
-from time import sleep
 from loguru import logger
 
-from scripts.job import Job
-from scripts.delete import delete_pods
+from scripts.image_cache import warm_up
+from scripts.job import START_LATENCIES, Job
+from scripts.job_graph import JobGraph
+from scripts.delete import delete_all_pods
+from scripts.output_sink import OutputSink
+from scripts.placement import optimized_jobs
+from scripts.remote_processes import REMOTE_PROCESSES
+from scripts.tracing import TRACER, traced_sleep
 from scripts.utils import (
     Part,
     install_mcperf,
+    mcperf_source_revision,
     is_memcached_ready,
-    pods_completed,
-    services_ready,
-    ssh_command,
+    wait_for_pods_ready,
+    wait_for_services_ready,
     start_cluster,
     run_command,
-    pods_ready,
-    get_node_info,
-    get_pods_info,
+    get_node_name,
     get_node_ip,
     get_pod_ip,
 )
 
 
-PROCESSES = []
 LOG_RESULTS = os.path.join(".", "results-part3", "final_runs", time.strftime("%Y-%m-%d-%H-%M"))
 os.makedirs(LOG_RESULTS, exist_ok=True)
 
@@ -34,38 +36,57 @@ os.makedirs(LOG_RESULTS, exist_ok=True)
 @click.option(
     "--start", "-s", help="Flag indicating if the cluster should be started", is_flag=True, default=False, type=bool
 )
-def task3(start: bool):
+@click.option(
+    "--optimize",
+    "-o",
+    help="Use the placement with the lowest predicted makespan instead of the hand-written one",
+    is_flag=True,
+    default=False,
+    type=bool,
+)
+def task3(start: bool, optimize: bool):
     try:
+        make_jobs = optimized_jobs if optimize else define_jobs
         if start:
-            start_cluster(part=Part.PART3)
+            # Defining the jobs (and searching a placement) only reads the manifests, it does not need the cluster
+            cluster = start_cluster(part=Part.PART3, wait_until_ready=False)
+            planned_jobs = cluster.run_alongside("jobs", make_jobs)
+            cluster.run_alongside("mcperf revision", mcperf_source_revision)
+            if not cluster.wait():
+                logger.error("The cluster is not ready, not deploying anything onto it")
+                sys.exit(1)
+            jobs = planned_jobs.result()
+        else:
+            jobs = make_jobs()
 
         start_memcached()
 
         install_mcperf()
 
+        # Pull all images before anything is timed, so that starting a job is only starting its container
+        warm_up_images(jobs)
+
         start_mcperf()
 
         # We need this so that we get mcperf logs before we start all the benchmarks
-        sleep(60)
-
-        schedule_batch_jobs()
+        traced_sleep(60, "mcperf warmup")
 
-        # wait for all PARSEC benchmarks to finish
-        while not pods_completed():
-            sleep(5)
+        # Returns once all PARSEC benchmarks have finished
+        schedule_batch_jobs(jobs)
 
         # We need this so that we get mcperf logs until all benchmarks have finished
-        sleep(60)
+        traced_sleep(60, "mcperf cooldown")
 
         log_time()
 
     except Exception as e:
         logger.error(e)
     finally:
-        for process in PROCESSES:
-            process.kill()
+        REMOTE_PROCESSES.terminate_all()
 
-        delete_pods()
+        delete_all_pods()
+
+        TRACER.export(os.path.join(LOG_RESULTS, "trace.json"))
 
 
 def start_memcached() -> None:
@@ -95,42 +116,25 @@ def start_memcached() -> None:
     ]
     run_command(expose_memcached_command)
 
-    while not pods_ready():
-        time.sleep(5)
+    wait_for_pods_ready()
 
     # Wait for the memcached service to be exposed!!
-    while not services_ready():
-        time.sleep(5)
+    wait_for_services_ready()
 
     logger.success("########### Memcached started ###########")
 
 
 def start_mcperf() -> None:
     logger.info("########### Starting Memcached on all 3 machines ###########")
-    global PROCESSES
-
-    node_info = get_node_info()
-    pod_info = get_pods_info()
 
-    client_agent_a_name = None
-    client_agent_b_name = None
-    client_measure_name = None
+    # All names and IPs are resolved from one cached topology snapshot
+    client_agent_a_name = get_node_name("client-agent-a")
+    client_agent_b_name = get_node_name("client-agent-b")
+    client_measure_name = get_node_name("client-measure")
     memcached_ip = get_pod_ip("some-memcached")
     client_agent_a_ip = get_node_ip("client-agent-a")
     client_agent_b_ip = get_node_ip("client-agent-b")
 
-    for line in node_info:
-        if line[0].startswith("client-agent-a"):
-            client_agent_a_name = line[0]
-        elif line[0].startswith("client-agent-b"):
-            client_agent_b_name = line[0]
-        elif line[0].startswith("client-measure"):
-            client_measure_name = line[0]
-
-    for line in pod_info:
-        if line[0].startswith("some-memcached"):
-            memcached_ip = line[5]
-
     if (
         client_agent_a_name is None
         or client_agent_b_name is None
@@ -140,30 +144,27 @@ def start_mcperf() -> None:
         print("Could not find client-agent-a, client-agent-b, client-measure, or memcached node")
         sys.exit(1)
 
-    f_a = open(os.path.join(LOG_RESULTS, "mcperf_a.txt"), "w")
-    f_b = open(os.path.join(LOG_RESULTS, "mcperf_b.txt"), "w")
+    f_a = OutputSink(os.path.join(LOG_RESULTS, "mcperf_a.txt"))
+    f_b = OutputSink(os.path.join(LOG_RESULTS, "mcperf_b.txt"))
 
     mcperf_agent_a_command = "./memcache-perf-dynamic/mcperf -T 2 -A"
-    res = ssh_command(client_agent_a_name, mcperf_agent_a_command, is_async=True, file=f_a)
-    PROCESSES.append(res)
+    REMOTE_PROCESSES.launch(client_agent_a_name, mcperf_agent_a_command, sink=f_a)
 
-    time.sleep(5)
+    traced_sleep(5, "mcperf agent a startup")
 
     mcperf_agent_b_command = "./memcache-perf-dynamic/mcperf -T 4 -A"
-    res = ssh_command(client_agent_b_name, mcperf_agent_b_command, is_async=True, file=f_b)
-    PROCESSES.append(res)
+    REMOTE_PROCESSES.launch(client_agent_b_name, mcperf_agent_b_command, sink=f_b)
 
-    time.sleep(5)
+    traced_sleep(5, "mcperf agent b startup")
 
-    log_file = open(os.path.join(LOG_RESULTS, "mcperf.txt"), "w")
+    log_file = OutputSink(os.path.join(LOG_RESULTS, "mcperf.txt"))
 
     mc_perf_measure_command = f"./memcache-perf-dynamic/mcperf -s {memcached_ip} --loadonly && ./memcache-perf-dynamic/mcperf -s {memcached_ip} -a {client_agent_a_ip} -a {client_agent_b_ip} --noload -T 6 -C 4 -D 4 -Q 1000 -c 4 -t 10 --scan 30000:30500:5"
 
-    res = ssh_command(client_measure_name, mc_perf_measure_command, is_async=True, file=log_file)
-    PROCESSES.append(res)
+    REMOTE_PROCESSES.launch(client_measure_name, mc_perf_measure_command, sink=log_file)
 
 
-def schedule_batch_jobs() -> None:
+def define_jobs() -> list[Job]:
     """blackscholes,canneal,dedup,ferret,freqmine,radix,vips
 
     node a has 2 high performance cores with 2GB of memory,
@@ -184,20 +185,27 @@ def schedule_batch_jobs() -> None:
     radix_job = Job("radix", "radix", "node-c-8core", "7", 1, benchmark_suite="splash2x")
     dedup_job = Job("dedup", "dedup", "node-c-8core", "7", 1, depends_on=[radix_job])
 
-    jobs = [ferret_job, freqmine_job, canneal_job, radix_job, blackscholes_job, vips_job, dedup_job]
+    return [ferret_job, freqmine_job, canneal_job, radix_job, blackscholes_job, vips_job, dedup_job]
+
+
+def warm_up_images(jobs: list[Job]) -> None:
+    images_by_node: dict[str, set[str]] = {}
+    for job in jobs:
+        images_by_node.setdefault(job.node_selector, set()).add(job.image)
+    warm_up(images_by_node, runtime="containerd")
 
-    while True:
-        unstarted_jobs = [job for job in jobs if not job.started]
-        if len(unstarted_jobs) == 0:
-            break
-        for job in unstarted_jobs:
-            job.start()
-        sleep(1)
+
+def schedule_batch_jobs(jobs: list[Job]) -> None:
+    JobGraph(jobs).run()
 
 
 def log_time():
-    get_command = f"kubectl get pods -o json > {os.path.join(LOG_RESULTS, 'results.json')}"
-    os.system(get_command)
+    START_LATENCIES.wait(timeout=10)
+    START_LATENCIES.save(os.path.join(LOG_RESULTS, "start_latency.json"))
+
+    res = run_command(["kubectl", "get", "pods", "-o", "json"], log_success=False)
+    with open(os.path.join(LOG_RESULTS, "results.json"), "wb") as f:
+        f.write(res.stdout)
     get_command = f"python3 get_time.py {os.path.join(LOG_RESULTS, 'results.json')} > {os.path.join(LOG_RESULTS, 'execution_time.txt')}"
     os.system(get_command)
 
@@ -1,19 +1,31 @@
+import asyncio
 import time
 import click
+import py_compile
 import sys
 import os
 from loguru import logger
 
+from scripts.async_utils import copy_file_from_node_async, ssh_command_async
+from scripts.image_cache import warm_up
+from scripts.output_sink import OutputSink
+from scripts.remote_processes import REMOTE_PROCESSES
+from scripts.tracing import TRACER, traced_sleep
+from scripts.utils import *
+from scripts.task4_config import *
 
-# add scripts to sys path
-try:
-    sys.path.append("scripts")
-except Exception as e:
-    print(e)
 
-
-from utils import *
-from task4_config import *
+# Scripts that run on the memcached node in part 2 (the controller and everything it imports)
+TASK4_SCRIPTS = [
+    "task4_controller.py",
+    "task4_scheduler_logger.py",
+    "task4_job.py",
+    "task4_config.py",
+    "task4_memcached_stats.py",
+    "task4_cpu_sampler.py",
+    "task4_container_events.py",
+    "task4_forecast.py",
+]
 
 
 @click.command()
@@ -25,8 +37,18 @@ from task4_config import *
 )
 def task4(start: bool, part: int):
 
+    if BACKEND.simulated:
+        # memcached comes from apt/systemctl and the part 2 controller drives docker, both are skipped on local nodes
+        logger.error("Part 4 needs memcached and docker on the nodes and cannot run on the local backend")
+        sys.exit(1)
+
     if start:
-        start_cluster(part=Part.PART4)
+        cluster = start_cluster(part=Part.PART4, wait_until_ready=False)
+        cluster.run_alongside("scripts", check_task4_scripts)
+        cluster.run_alongside("mcperf revision", mcperf_source_revision)
+        if not cluster.wait():
+            logger.error("The cluster is not ready, not deploying anything onto it")
+            sys.exit(1)
 
     if part == 1:
         run_part1()
@@ -35,13 +57,13 @@ def task4(start: bool, part: int):
 
 
 def run_part1():
+    base_log_dir = os.path.join(".", "results-part4", "part1", time.strftime("%Y-%m-%d-%H-%M"))
+    os.makedirs(base_log_dir, exist_ok=True)
+
     try:
         install_mcperf(False)
 
-        memcached_name = None
-        for line in get_node_info():
-            if line[0].startswith(MEMCACHED):
-                memcached_name = line[0]
+        memcached_name = get_node_name(MEMCACHED)
         if memcached_name is None:
             logger.error("Could not find the memcached node")
             sys.exit(1)
@@ -51,8 +73,6 @@ def run_part1():
         num_thread_candidates = [1, 2]
         cores_candidates = [[1], [1, 2]]
 
-        base_log_dir = os.path.join(".", "results-part4", "part1", time.strftime("%Y-%m-%d-%H-%M"))
-        os.makedirs(base_log_dir, exist_ok=True)
         ssh_command(memcached_name, "lscpu > ~/lscpu.txt")
         copy_file_from_node(memcached_name, "~/lscpu.txt", os.path.join(base_log_dir, "lscpu.txt"))
 
@@ -66,7 +86,7 @@ def run_part1():
                 for i in range(3):
 
                     ssh_command(memcached_name, "sudo systemctl restart memcached")
-                    time.sleep(10)
+                    traced_sleep(10, "memcached restart")
 
                     log_results = os.path.join(
                         base_log_dir,
@@ -75,13 +95,13 @@ def run_part1():
                     )
                     os.makedirs(log_results, exist_ok=True)
 
-                    cpu_file = open(os.path.join(log_results, "cpu_utils.txt"), "w")
-                    ssh_command(memcached_name, "taskset -c 3 python3 ~/task4_cpu.py", is_async=True, file=cpu_file)  # type: ignore
+                    cpu_file = OutputSink(os.path.join(log_results, "cpu_utils.txt"))
+                    REMOTE_PROCESSES.launch(memcached_name, "taskset -c 3 python3 ~/task4_cpu.py", sink=cpu_file)
 
                     taskset_command = f"sudo taskset -a -cp {','.join(list(map(str, cores)))} $(pgrep memcached)"
                     ssh_command(memcached_name, taskset_command)
 
-                    time.sleep(10)
+                    traced_sleep(10, "memcached pinning")
 
                     ssh_command(memcached_name, "sudo systemctl status memcached")
 
@@ -90,18 +110,19 @@ def run_part1():
 
                     start_mcperf(agent_command=agent_command, measure_command=measure_command, log_results=log_results)
 
-                    time.sleep(200)
+                    traced_sleep(200, "mcperf run")
+
+                    # Stop the agent and the sampler so they do not skew the next run
+                    REMOTE_PROCESSES.terminate_all()
 
     finally:
+        REMOTE_PROCESSES.terminate_all()
+        TRACER.export(os.path.join(base_log_dir, "trace.json"))
         print("Part 1 done")
 
 
 def run_part2():
-    memcached_name = None
-    for line in get_node_info():
-        if line[0].startswith(MEMCACHED):
-            memcached_name = line[0]
-            break
+    memcached_name = get_node_name(MEMCACHED)
     if memcached_name is None:
         logger.error("Could not find the memcached node")
         sys.exit(1)
@@ -110,14 +131,19 @@ def run_part2():
     os.makedirs(base_log_dir, exist_ok=True)
 
     try:
-        copy_task4(["task4_controller.py", "task4_scheduler_logger.py", "task4_job.py", "task4_config.py"])
+        copy_task4(TASK4_SCRIPTS)
         install_memcached(num_threads=2)
         install_docker()
 
-        for docker_image in DOCKERIMAGES.values():
-            ssh_command(memcached_name, f"sudo docker pull {docker_image}")
+        async def prepare_nodes():
+            # Pulling (and verifying) the images on the memcached node and installing mcperf on the client nodes are
+            # independent
+            await asyncio.gather(
+                asyncio.to_thread(warm_up, {memcached_name: set(DOCKERIMAGES.values())}, "docker"),
+                asyncio.to_thread(install_mcperf, False),
+            )
 
-        install_mcperf(False)
+        asyncio.run(prepare_nodes())
 
         mcperf_time = 900
 
@@ -127,44 +153,47 @@ def run_part2():
         start_mcperf(agent_command=agent_command, measure_command=measure_command, log_results=base_log_dir)
         start_time = time.time()
 
-        time.sleep(5)
+        traced_sleep(5, "mcperf startup")
 
         start_memcached_controller()
 
         # After mcperf_time seconds, the memcached controller should be finished and additionally the mcperf command should have finished as well
         while True:
-            time.sleep(10)
+            traced_sleep(10, "mcperf run")
             if time.time() - start_time > mcperf_time + 10:
                 break
             logger.info(f"{mcperf_time - (time.time() - start_time)} seconds remaining")
 
-        res = ssh_command(memcached_name, "ls")
-        files = res.stdout.decode("utf-8").split("\n")  # type: ignore
-        files = [f for f in files if f.startswith("log") and f.endswith(".txt")]
-        for f in files:
-            copy_file_from_node(memcached_name, f"~/{f}", os.path.join(base_log_dir, "log.txt"))
+        asyncio.run(collect_controller_logs(memcached_name, base_log_dir))
 
     finally:
         stop_comand = "sudo docker stop $(docker ps -a -q)"
         remove_command = "sudo docker rm -f $(docker ps -a -q)"
-        for line in get_node_info():
-            if line[0].startswith(MEMCACHED):
-                ssh_command(line[0], stop_comand)
-                ssh_command(line[0], remove_command)
-                ssh_command(line[0], "sudo rm log*.txt")
-            if line[0].startswith("client-agent") or line[0].startswith("client-measure"):
-                ssh_command(line[0], "sudo pkill mcperf")
+        ssh_fan_out(MEMCACHED, f"{stop_comand}; {remove_command}; sudo rm log*.txt forecast*.txt")
+        REMOTE_PROCESSES.terminate_all()
+        TRACER.export(os.path.join(base_log_dir, "trace.json"))
 
 
-def start_memcached_controller():
-    logger.info("########### Starting Memcached Controller ###########")
-    node_info = get_node_info()
-    memcached_name = None
+async def collect_controller_logs(memcached_name: str, base_log_dir: str):
+    res = await ssh_command_async(memcached_name, "ls")
+    files = res.stdout.decode("utf-8").split("\n")
+
+    # The scheduler log and the forecast of the controller next to the measured load (see task4_forecast.ForecastLog)
+    # are copied at the same time. Both are named after the controller's start time, so the last one is of this run.
+    copies = []
+    for prefix, local_name in [("log", "log.txt"), ("forecast", "forecast.txt")]:
+        matches = sorted(f for f in files if f.startswith(prefix) and f.endswith(".txt"))
+        if len(matches) > 0:
+            remote_path = f"~/{matches[-1]}"
+            copies.append(
+                copy_file_from_node_async(memcached_name, remote_path, os.path.join(base_log_dir, local_name))
+            )
+    await asyncio.gather(*copies)
 
-    for line in node_info:
-        if line[0].startswith(MEMCACHED):
-            memcached_name = line[0]
 
+def start_memcached_controller():
+    logger.info("########### Starting Memcached Controller ###########")
+    memcached_name = get_node_name(MEMCACHED)
     memcached_ip = get_node_ip(MEMCACHED)
 
     if memcached_name is None or memcached_ip is None:
@@ -176,87 +205,101 @@ def start_memcached_controller():
     logger.success(f"Finished running memcached controller on {memcached_name}")
 
 
+def check_task4_scripts():
+    # A syntax error in the node-side scripts should show before the nodes are provisioned, not when they are started
+    for file_name in TASK4_SCRIPTS + ["task4_cpu.py"]:
+        py_compile.compile(os.path.join(".", "scripts", file_name), doraise=True)
+
+
 def copy_task4(files: list[str]):
     requirements_file_name = "requirements_part4.txt"
 
     source_folder = os.path.join(".", "scripts")
-    destination = os.path.join("~")
 
-    for line in get_node_info():
-        if line[0].startswith(MEMCACHED):
-            for file_name in files:
-                source_file = os.path.join(source_folder, file_name)
-                copy_file_to_node(line[0], source_file, destination)
+    def copy_to_node(node: str):
+        # All scripts and the requirements file are sent in one batch (to the home directory)
+        sync_files_to_node(
+            node, [(os.path.join(source_folder, file_name), file_name) for file_name in files + [requirements_file_name]]
+        )
 
-            requirements_file = os.path.join(source_folder, requirements_file_name)
-            copy_file_to_node(line[0], requirements_file, destination)
+        logger.info(f"Copied python scripts to {node}")
 
-            logger.info(f"Copied python scripts to {line[0]}")
+        def install_requirements():
+            ssh_command(node, f"sudo apt install python3-pip -y")
+            return ssh_command(node, f"pip install -r {requirements_file_name}")
 
-            ssh_command(line[0], f"sudo apt install python3-pip -y")
-            ssh_command(line[0], f"pip install -r {requirements_file_name}")
+        requirements_fingerprint = file_fingerprint(os.path.join(source_folder, requirements_file_name))
+        Provisioner(node).step("requirements_part4", requirements_fingerprint, install_requirements)
 
-            logger.success(f"Installed requirements to {line[0]}")
+        logger.success(f"Installed requirements to {node}")
+
+    fan_out(MEMCACHED, copy_to_node, fail_fast=True)
 
 
 def install_docker():
-    for line in get_node_info():
-        if line[0].startswith(MEMCACHED):
-            source_path = "./scripts/install_docker.sh"
-            destination_path = "~/install_docker.sh"
+    source_path = "./scripts/install_docker.sh"
+
+    def install(node: str):
+        sync_files_to_node(node, [(source_path, "install_docker.sh")])
+        with OutputSink(os.path.join(PROVISIONING_LOGS, f"{node}-install_docker.txt")) as sink:
+            ssh_command(node, "sudo bash ~/install_docker.sh", file=sink)
 
-            copy_file_to_node(line[0], source_path, destination_path)
-            ssh_command(line[0], "sudo bash ~/install_docker.sh")
+        res = ssh_command(node, f"sudo usermod -a -G docker ubuntu")
 
-            ssh_command(line[0], f"sudo usermod -a -G docker ubuntu")
+        traced_sleep(5, "docker group change")
+        return res
 
-            time.sleep(5)
+    def install_on_node(node: str):
+        Provisioner(node).step("docker", file_fingerprint(source_path), lambda: install(node))
+        logger.info(f"Installed docker to {node}")
 
-            logger.info(f"Installed docker to {line[0]}")
+    fan_out(MEMCACHED, install_on_node, fail_fast=True)
 
 
 def install_memcached(num_threads: int):
-    for line in get_node_info():
-        if line[0].startswith(MEMCACHED):
+    memcached_ip = get_node_ip(MEMCACHED)
+    if memcached_ip is None:
+        print("Could not find the IP of the memcache server")
+        sys.exit(1)
 
-            memcached_ip = get_node_ip(MEMCACHED)
-            if memcached_ip is None:
-                print("Could not find the IP of the memcache server")
-                sys.exit(1)
+    packages = "memcached libmemcached-tools"
 
-            ssh_command(line[0], "sudo apt update")
-            ssh_command(line[0], "sudo apt install -y memcached libmemcached-tools")
+    # copy only once, to use as a starting point
+    with open("./scripts/memcached.conf", "r") as f:
+        content = (
+            f.read()
+            .replace("MEMCACHED_INTERNAL_IP", memcached_ip)
+            .replace("MEMORY_LIMIT", "1024")
+            .replace("NUM_THREADS", f"{num_threads}")
+        )
 
-            # copy only once, to use as a starting point
-            with open("./scripts/memcached.conf", "r") as f:
-                content = (
-                    f.read()
-                    .replace("MEMCACHED_INTERNAL_IP", memcached_ip)
-                    .replace("MEMORY_LIMIT", "1024")
-                    .replace("NUM_THREADS", f"{num_threads}")
-                )
-                ssh_command(line[0], f'sudo printf "{content}" > ~/memcached.conf')
+    def install_packages(node: str):
+        with OutputSink(os.path.join(PROVISIONING_LOGS, f"{node}-install_memcached.txt")) as sink:
+            ssh_command(node, "sudo apt update", file=sink)
+            return ssh_command(node, f"sudo apt install -y {packages}", file=sink)
 
-            ssh_command(line[0], "sudo mv ~/memcached.conf /etc/memcached.conf")
-            ssh_command(line[0], "sudo systemctl restart memcached")
+    def install_config(node: str):
+        ssh_command(node, f'sudo printf "{content}" > ~/memcached.conf')
+        ssh_command(node, "sudo mv ~/memcached.conf /etc/memcached.conf")
+        res = ssh_command(node, "sudo systemctl restart memcached")
 
-            time.sleep(10)
+        traced_sleep(10, "memcached restart")
+        return res
 
-            logger.success(f"Installed memcached to {line[0]}")
+    def install_on_node(node: str):
+        provisioner = Provisioner(node)
+        provisioner.step("memcached_packages", fingerprint(packages), lambda: install_packages(node))
+        provisioner.step("memcached_config", fingerprint(content), lambda: install_config(node))
 
+        logger.success(f"Installed memcached to {node}")
 
-def start_mcperf(agent_command: str, measure_command: str, log_results: str):
-    logger.info("########### Starting Mcperf on all 2 machines ###########")
-    node_info = get_node_info()
-    client_agent_name = None
-    client_measure_name = None
+    fan_out(MEMCACHED, install_on_node, fail_fast=True)
 
-    for line in node_info:
-        if line[0].startswith("client-agent"):
-            client_agent_name = line[0]
-        elif line[0].startswith("client-measure"):
-            client_measure_name = line[0]
 
+def start_mcperf(agent_command: str, measure_command: str, log_results: str):
+    logger.info("########### Starting Mcperf on all 2 machines ###########")
+    client_agent_name = get_node_name("client-agent")
+    client_measure_name = get_node_name("client-measure")
     client_agent_ip = get_node_ip("client-agent")
     memcached_ip = get_node_ip(MEMCACHED)
 
@@ -264,13 +307,13 @@ def start_mcperf(agent_command: str, measure_command: str, log_results: str):
         print("Could not find client-agent-name, client-measure, or memcached node")
         sys.exit(1)
 
-    log_agent_file = open(os.path.join(log_results, "mcperf_agent.txt"), "w")
-    ssh_command(client_agent_name, agent_command, is_async=True, file=log_agent_file)  # type: ignore
+    log_agent_file = OutputSink(os.path.join(log_results, "mcperf_agent.txt"))
+    REMOTE_PROCESSES.launch(client_agent_name, agent_command, sink=log_agent_file)
 
     measure_command = measure_command.replace("MEMCACHED_IP", memcached_ip).replace("AGENT_IP", client_agent_ip)
 
-    log_file = open(os.path.join(log_results, "mcperf.txt"), "w")
-    ssh_command(client_measure_name, measure_command, is_async=True, file=log_file)  # type: ignore
+    log_file = OutputSink(os.path.join(log_results, "mcperf.txt"))
+    REMOTE_PROCESSES.launch(client_measure_name, measure_command, sink=log_file)
 
 
 if __name__ == "__main__":
@@ -46,6 +46,17 @@ CPU_CORES = {
 }
 
 
+# Seconds between two iterations of the controller's loop
+LOOP_INTERVAL = 0.1
+
+# Scaling decisions are made on the load forecast this many seconds ahead (see task4_forecast.FORECASTERS)
+FORECASTER = "holt"
+FORECAST_HORIZON = 0.3
+
+# memcached only gives up its second core once its threads together have used less than this (in percent of one core)
+# over the last 5 loop iterations, and not within 5 iterations of its cores changing
+MEMCACHED_CPU_LIMIT = 80
+
 # CHANGE_THRESHOLD * 10 is the QPS at which we will switch from 1 to 2 cores or vice versa
 CHANGE_THRESHOLD = 5000
 THRESHOLDS = {
@@ -0,0 +1,77 @@
+"""
+State of the controller's containers, kept up to date from the Docker events stream instead of a `container.reload()`
+per query.
+"""
+
+import threading
+from typing import Callable, Optional
+
+import docker.models.containers
+from docker.client import DockerClient
+from loguru import logger
+
+
+# Docker event action -> container status it leads to
+STATUS_AFTER = {
+    "create": "created",
+    "start": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "die": "exited",
+    "destroy": "removed",
+}
+
+
+class ContainerEvents:
+    def __init__(self, client: DockerClient):
+        self.statuses: dict[str, str] = {}
+        self._condition = threading.Condition()
+        # Set once the stream is gone, from then on the statuses are no longer updated
+        self.ended = False
+        self._stopping = False
+        # Subscribe before any container is started, so that no event is missed
+        self._stream = client.events(decode=True, filters={"type": "container", "event": list(STATUS_AFTER)})
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    def _consume(self) -> None:
+        try:
+            for event in self._stream:
+                status = STATUS_AFTER.get(event.get("Action", event.get("status", "")))
+                container_id = event.get("id") or event.get("Actor", {}).get("ID")
+                if status is None or container_id is None:
+                    continue
+                with self._condition:
+                    if container_id in self.statuses:
+                        self.statuses[container_id] = status
+                        self._condition.notify_all()
+        except Exception as e:
+            # The stream is closed by `stop`, anything else means the states are no longer updated
+            if not self._stopping:
+                logger.error(f"Docker events stream failed: {e}")
+        else:
+            if not self._stopping:
+                logger.error("Docker events stream ended")
+        with self._condition:
+            self.ended = True
+            self._condition.notify_all()
+
+    def track(self, container: docker.models.containers.Container) -> None:
+        with self._condition:
+            self.statuses.setdefault(container.id, container.status.lower())  # type: ignore
+
+    def status(self, container_id: str) -> str:
+        with self._condition:
+            return self.statuses.get(container_id, "unknown")
+
+    def wait_for(self, predicate: Callable[[], bool], timeout: Optional[float] = None) -> bool:
+        """Blocks until `predicate()` is true after an event, or until the timeout expires."""
+        with self._condition:
+            return self._condition.wait_for(predicate, timeout=timeout)
+
+    def wait_for_exit(self, container_id: str, timeout: Optional[float] = None) -> bool:
+        return self.wait_for(lambda: self.statuses.get(container_id, "").startswith("exited"), timeout=timeout)
+
+    def stop(self) -> None:
+        self._stopping = True
+        self._stream.close()
@@ -8,13 +8,16 @@ import docker
 import docker.models
 import docker.models.containers
 from docker.client import DockerClient
-import psutil
 import subprocess
-from collections import deque
+from typing import Optional
 
 from task4_scheduler_logger import SchedulerLogger
 from task4_job import ControllerJob
-from task4_config import JobEnum
+from task4_config import FORECAST_HORIZON, FORECASTER, LOOP_INTERVAL, MEMCACHED_CPU_LIMIT, JobEnum
+from task4_cpu_sampler import CpuSampler
+from task4_container_events import ContainerEvents
+from task4_memcached_stats import MemcachedStats
+from task4_forecast import ForecastLog, make_forecaster
 
 
 def memcached_pid() -> str:
@@ -31,15 +34,23 @@ class Controller:
 
     def __init__(self, memcached_ip: str):
         self.client: DockerClient = docker.from_env()
+        # Container states come from the events stream, so the loop does not ask the daemon every iteration
+        self.events = ContainerEvents(self.client)
         self.jobs: list[ControllerJob] = []
         self.memcached_pid = memcached_pid()
         self.num_memcached_cores = 2
         self.logger = SchedulerLogger()
-        self.measurement_list = deque(maxlen=10)
+        # Sampled once per iteration of the schedule loop, the scale-down decision reads from it
+        self.sampler = CpuSampler(self.memcached_pid)
+        # Sample count when memcached's cores last changed, older samples do not describe the current allocation
+        self.cores_changed_at = 0
 
         self.memached_ip = memcached_ip
-        self.curr_qps_deque = deque(maxlen=5)
-        self.prev_qps = 0
+        self.stats = MemcachedStats(memcached_ip)
+        self.forecaster = make_forecaster(FORECASTER)
+        self.forecast_log = ForecastLog(FORECASTER)
+        # None until the first forecast, no scaling decision is made before that
+        self.prev_forecast: Optional[float] = None
 
     def start_controlling(self):
         # Start memcached on core 0, do not use the set_memcached_cores function since we do not want to log the update_cores here
@@ -52,14 +63,14 @@ class Controller:
     def set_memcached_cores(self, cores: list[int]):
         if len(cores) == self.num_memcached_cores:
             return
-        self.measurement_list.clear()
+        self.cores_changed_at = self.sampler.count
         self.num_memcached_cores = len(cores)
         taskset_command = f"sudo taskset -a -c {','.join(list(map(str, cores)))} -p {self.memcached_pid}"
         subprocess.run(taskset_command.split())
         self.logger.update_cores(JobEnum.MEMCACHED, cores=cores)
 
     def job_create(self, job_enum: JobEnum) -> ControllerJob:
-        controller_job = ControllerJob(job_enum, client=self.client, logger=self.logger)
+        controller_job = ControllerJob(job_enum, client=self.client, logger=self.logger, events=self.events)
 
         controller_job.create_container()
 
@@ -72,64 +83,46 @@ class Controller:
                 continue
             self.job_create(job)
 
-    def is_memcached_overloaded(self, cpu_threshold) -> bool:
-        cpu_percent = psutil.cpu_percent(percpu=True)
-
-        if cpu_percent[0] == 0.0 or (self.num_memcached_cores == 2 and cpu_percent[1] == 0.0):
-            return False
-
-        if self.num_memcached_cores == 1:
-            self.measurement_list.append(cpu_percent[0])
-        else:
-            self.measurement_list.append(cpu_percent[0] + cpu_percent[1])
-
-        if len(self.measurement_list) < 5:
-            return False
-
-        return sum(self.measurement_list) / len(self.measurement_list) > cpu_threshold
-
-    def is_memcached_underloaded(self, cpu_threshold) -> bool:
-        cpu_percent = psutil.cpu_percent(percpu=True)
-
-        if cpu_percent[0] == 0.0 or (self.num_memcached_cores == 2 and cpu_percent[1] == 0.0):
-            return False
-
-        if self.num_memcached_cores == 1:
-            self.measurement_list.append(cpu_percent[0])
-        else:
-            self.measurement_list.append(cpu_percent[0] + cpu_percent[1])
-
-        if len(self.measurement_list) < 5:
-            return False
-
-        return sum(self.measurement_list) / len(self.measurement_list) < cpu_threshold
-
-    def curr_qps(self):
-        result = subprocess.run(
-            f"echo stats | nc {self.memached_ip} 11211 -N", shell=True, text=True, capture_output=True
-        )
+    def memcached_cpu(self, window: int = 5) -> Optional[float]:
+        """
+        Utilization of memcached's threads over the last `window` ticks, in percent of one core. None until there are
+        enough samples since its cores last changed.
+        """
+        if self.sampler.count - self.cores_changed_at <= window or not self.sampler.available(window):
+            return None
+        # Counted per thread, so that whatever else runs on memcached's cores does not keep it from scaling down
+        return self.sampler.memcached_utilization(window)
+
+    def is_memcached_underloaded(self, cpu_threshold, window: int = 5) -> bool:
+        cpu = self.memcached_cpu(window)
+        return cpu is not None and cpu < cpu_threshold
+
+    def curr_qps(self) -> Optional[float]:
+        sample = self.stats.sample()
+        if sample is None:
+            self.logger.custom_event(JobEnum.MEMCACHED, "ERROR GETTING QPS")
 
-        cmd_get = None
-        for line in result.stdout.splitlines():
-            if line.startswith("STAT cmd_get"):
-                cmd_get = int(line.split()[-1])
+        delta = None if sample is None else self.stats.delta(sample)
+        if sample is None or delta is None:
+            return self.prev_forecast
 
-        if cmd_get is None:
-            self.logger.custom_event(JobEnum.MEMCACHED, "ERROR GETTING QPS")
-            if len(self.curr_qps_deque) == 0:
-                return 0
-            return sum(self.curr_qps_deque) / len(self.curr_qps_deque)
+        # Gets per loop interval, measured over the time that actually passed between the two samples
+        actual = delta.per_interval(LOOP_INTERVAL)
+        self.forecast_log.actual(sample.timestamp, actual)
 
-        self.curr_qps_deque.append(cmd_get - self.prev_qps)
-        self.prev_qps = cmd_get
+        # Decisions are made on the load expected by the time a core change takes effect, not on the current one
+        self.forecaster.update(sample.timestamp, actual)
+        self.prev_forecast = self.forecaster.forecast(FORECAST_HORIZON)
+        self.forecast_log.forecast(sample.timestamp, FORECAST_HORIZON, self.prev_forecast)
 
-        return sum(self.curr_qps_deque) / len(self.curr_qps_deque)
+        return self.prev_forecast
 
     def schedule_loop(self):
         current_job: ControllerJob = self.jobs.pop(0)
         current_job.start_container()
 
         while True:
+            self.sampler.tick()
             curr_job_finished = current_job.is_finished()
 
             if curr_job_finished:
@@ -146,15 +139,26 @@ class Controller:
                     current_job.update_cores([1, 2, 3])
             else:
                 curr_qps = self.curr_qps()
-                if self.num_memcached_cores == 1 and curr_qps > current_job.threshold:
+                if curr_qps is None:
+                    pass
+                elif self.num_memcached_cores == 1 and curr_qps > current_job.threshold:
                     self.set_memcached_cores([0, 1])
                     current_job.update_cores([2, 3])
-                elif self.num_memcached_cores == 2 and curr_qps < current_job.threshold:
+                elif (
+                    self.num_memcached_cores == 2
+                    and curr_qps < current_job.threshold
+                    and self.is_memcached_underloaded(MEMCACHED_CPU_LIMIT)
+                ):
+                    # The forecast can be low while memcached still keeps more than one core busy
                     self.set_memcached_cores([0])
                     current_job.update_cores([1, 2, 3])
 
-            time.sleep(0.1)
+            # Wakes up as soon as the current job exits, so the next one starts without waiting for the interval
+            self.events.wait_for_exit(current_job.container.id, timeout=LOOP_INTERVAL)  # type: ignore
 
+        self.events.stop()
+        self.stats.close()
+        self.forecast_log.close()
         time.sleep(60)
         self.logger.job_end(JobEnum.MEMCACHED)
 
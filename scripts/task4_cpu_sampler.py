@@ -0,0 +1,100 @@
+"""
+CPU utilization of every core and of every memcached thread, sampled once per controller tick from /proc.
+
+Each tick stores the cumulative counters in preallocated ring buffers, and utilization over the last `window` ticks
+is the difference of two entries, so any number of policies can read the same snapshot without resetting a
+measurement window (as calling psutil.cpu_percent twice per tick does).
+"""
+
+import glob
+import os
+import time
+
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def read_cores(path: str = "/proc/stat") -> list[tuple[int, int]]:
+    """(busy, total) jiffies of every core since boot."""
+    cores = []
+    with open(path) as f:
+        for line in f:
+            # cpu0 user nice system idle iowait irq softirq steal guest guest_nice
+            if not line.startswith("cpu") or line.startswith("cpu "):
+                continue
+            values = [int(value) for value in line.split()[1:9]]
+            total = sum(values)
+            cores.append((total - values[3] - values[4], total))
+    return cores
+
+
+def read_threads(pid: str) -> dict[int, int]:
+    """Thread id -> user + system jiffies of every thread of the process."""
+    threads = {}
+    for path in glob.glob(f"/proc/{pid}/task/*/stat"):
+        try:
+            with open(path) as f:
+                content = f.read()
+        except OSError:
+            # The thread exited in the meantime
+            continue
+        # The command name may contain spaces, the fields after it do not: "<tid> (<comm>) <state> ..."
+        fields = content[content.rindex(")") + 2 :].split()
+        threads[int(content.split(" ", 1)[0])] = int(fields[11]) + int(fields[12])
+    return threads
+
+
+class CpuSampler:
+    def __init__(self, pid: str, capacity: int = 64):
+        self.pid = pid
+        self.capacity = capacity
+        self.nr_cores = len(read_cores())
+        self.count = 0
+        self.timestamps = [0.0] * capacity
+        self.core_busy = [[0] * self.nr_cores for _ in range(capacity)]
+        self.core_total = [[0] * self.nr_cores for _ in range(capacity)]
+        self.threads: list[dict[int, int]] = [{} for _ in range(capacity)]
+
+    def tick(self) -> None:
+        slot = self.count % self.capacity
+        self.timestamps[slot] = time.monotonic()
+        busy, total = self.core_busy[slot], self.core_total[slot]
+        for core, (core_busy, core_total) in enumerate(read_cores()[: self.nr_cores]):
+            busy[core] = core_busy
+            total[core] = core_total
+        self.threads[slot] = read_threads(self.pid)
+        self.count += 1
+
+    def available(self, window: int) -> bool:
+        """Whether there are enough samples for utilization over `window` ticks."""
+        return 0 < window < self.capacity and self.count > window
+
+    def _slots(self, window: int) -> tuple[int, int]:
+        if not self.available(window):
+            raise ValueError(f"Not enough samples for a window of {window} ticks ({self.count} samples)")
+        return (self.count - 1 - window) % self.capacity, (self.count - 1) % self.capacity
+
+    def core_utilization(self, window: int = 5) -> list[float]:
+        """Utilization of every core over the last `window` ticks, in percent."""
+        first, last = self._slots(window)
+        utilization = []
+        for core in range(self.nr_cores):
+            total = self.core_total[last][core] - self.core_total[first][core]
+            busy = self.core_busy[last][core] - self.core_busy[first][core]
+            utilization.append(100 * busy / total if total > 0 else 0.0)
+        return utilization
+
+    def thread_utilization(self, window: int = 5) -> dict[int, float]:
+        """Utilization of every memcached thread over the last `window` ticks, in percent of one core."""
+        first, last = self._slots(window)
+        elapsed = self.timestamps[last] - self.timestamps[first]
+        if elapsed <= 0:
+            return {}
+        return {
+            tid: 100 * (jiffies - self.threads[first].get(tid, 0)) / CLOCK_TICKS / elapsed
+            for tid, jiffies in self.threads[last].items()
+        }
+
+    def memcached_utilization(self, window: int = 5) -> float:
+        """Utilization of all memcached threads together, in percent of one core."""
+        return sum(self.thread_utilization(window).values())
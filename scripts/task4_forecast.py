@@ -0,0 +1,153 @@
+"""
+Forecasts of memcached's load a short time ahead, so that the controller can give memcached its second core before a
+load increase is visible in the measurements.
+
+Every forecaster is fed (timestamp, value) samples and predicts the value `horizon` seconds after the last sample.
+"""
+
+import math
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+
+class Forecaster:
+    def update(self, timestamp: float, value: float) -> None:
+        raise NotImplementedError
+
+    def forecast(self, horizon: float) -> float:
+        raise NotImplementedError
+
+
+class MovingAverage(Forecaster):
+    """Mean of the last `window` samples, i.e. what the controller used before forecasting."""
+
+    def __init__(self, window: int = 5):
+        self.values: deque[float] = deque(maxlen=window)
+
+    def update(self, timestamp: float, value: float) -> None:
+        self.values.append(value)
+
+    def forecast(self, horizon: float) -> float:
+        return sum(self.values) / len(self.values) if len(self.values) > 0 else 0.0
+
+
+class Ewma(Forecaster):
+    """Exponentially weighted moving average, `half_life` seconds is how fast old samples lose half their weight."""
+
+    def __init__(self, half_life: float = 0.3):
+        self.half_life = half_life
+        self.level: Optional[float] = None
+        self.last_timestamp = 0.0
+
+    def update(self, timestamp: float, value: float) -> None:
+        if self.level is None:
+            self.level = value
+        else:
+            alpha = 1 - math.pow(0.5, (timestamp - self.last_timestamp) / self.half_life)
+            self.level += alpha * (value - self.level)
+        self.last_timestamp = timestamp
+
+    def forecast(self, horizon: float) -> float:
+        return self.level if self.level is not None else 0.0
+
+
+class Holt(Forecaster):
+    """Holt's linear trend method: an EWMA of the level and one of its change per second, extrapolated linearly."""
+
+    def __init__(self, alpha: float = 0.5, beta: float = 0.2):
+        self.alpha = alpha
+        self.beta = beta
+        self.level: Optional[float] = None
+        self.trend = 0.0
+        self.last_timestamp = 0.0
+
+    def update(self, timestamp: float, value: float) -> None:
+        if self.level is None:
+            self.level = value
+            self.last_timestamp = timestamp
+            return
+        elapsed = timestamp - self.last_timestamp
+        if elapsed <= 0:
+            return
+        previous_level = self.level
+        self.level = self.alpha * value + (1 - self.alpha) * (self.level + self.trend * elapsed)
+        self.trend = self.beta * (self.level - previous_level) / elapsed + (1 - self.beta) * self.trend
+        self.last_timestamp = timestamp
+
+    def forecast(self, horizon: float) -> float:
+        if self.level is None:
+            return 0.0
+        return max(self.level + self.trend * horizon, 0.0)
+
+
+class QuantileForecaster(Forecaster):
+    """
+    Last value plus the `quantile` of the recent changes per second times the horizon: a forecast that is exceeded
+    only as often as the load rose faster than that in the last `window` samples.
+    """
+
+    def __init__(self, window: int = 20, quantile: float = 0.9):
+        self.quantile = quantile
+        self.samples: deque[tuple[float, float]] = deque(maxlen=window)
+
+    def update(self, timestamp: float, value: float) -> None:
+        self.samples.append((timestamp, value))
+
+    def forecast(self, horizon: float) -> float:
+        if len(self.samples) == 0:
+            return 0.0
+        samples = list(self.samples)
+        rates = sorted(
+            (value - previous_value) / (timestamp - previous_timestamp)
+            for (previous_timestamp, previous_value), (timestamp, value) in zip(samples, samples[1:])
+            if timestamp > previous_timestamp
+        )
+        if len(rates) == 0:
+            return samples[-1][1]
+        rate = rates[min(int(self.quantile * len(rates)), len(rates) - 1)]
+        return max(samples[-1][1] + rate * horizon, 0.0)
+
+
+FORECASTERS = {
+    "average": MovingAverage,
+    "ewma": Ewma,
+    "holt": Holt,
+    "quantile": QuantileForecaster,
+}
+
+
+def make_forecaster(name: str) -> Forecaster:
+    if name not in FORECASTERS:
+        raise ValueError(f"Unknown forecaster {name}, expected one of {', '.join(FORECASTERS)}")
+    return FORECASTERS[name]()
+
+
+class ForecastLog:
+    """
+    Writes every forecast next to the value that was actually measured at the time it was made for:
+    `<timestamp> <actual> <forecast> <error>`
+    """
+
+    def __init__(self, name: str):
+        start_date = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.file = open(f"forecast{start_date}.txt", "w")
+        self.file.write(f"# forecaster {name}\n")
+        # (monotonic time the forecast is for, forecast)
+        self.pending: deque[tuple[float, float]] = deque()
+
+    def forecast(self, timestamp: float, horizon: float, value: float) -> None:
+        self.pending.append((timestamp + horizon, value))
+
+    def actual(self, timestamp: float, value: float) -> None:
+        # The forecast for the latest point in time that has been reached is compared against this sample
+        matched = None
+        while len(self.pending) > 0 and self.pending[0][0] <= timestamp:
+            matched = self.pending.popleft()
+        if matched is None:
+            return
+        self.file.write(f"{datetime.now().isoformat()} {value:.1f} {matched[1]:.1f} {matched[1] - value:.1f}\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
@@ -1,16 +1,18 @@
 import docker.errors
 from loguru import logger
 from task4_scheduler_logger import SchedulerLogger
+from task4_container_events import ContainerEvents
 from task4_config import CPU_CORES, DOCKERIMAGES, NR_THREADS, THRESHOLDS, JobEnum
 import docker.models.containers
 from docker.client import DockerClient
 
 class ControllerJob:
 
-    def __init__(self, job: JobEnum, client: DockerClient, logger: SchedulerLogger):
+    def __init__(self, job: JobEnum, client: DockerClient, logger: SchedulerLogger, events: ContainerEvents):
         self.job = job
         self.client = client
         self.logger = logger
+        self.events = events
 
         self.image = DOCKERIMAGES[job]
         self.nr_threads = NR_THREADS[job]
@@ -34,6 +36,7 @@ class ControllerJob:
             command=self.run_command,
             detach=True,
         )  # type: ignore
+        self.events.track(self.container)
 
         # If the container is created, it does not start yet so we set the state to paused
         self.is_paused = True
@@ -42,13 +45,21 @@ class ControllerJob:
 
     def start_container(self) -> bool:
         self.container.start()
+        # The start event may arrive after the API call returned, wait for it so that update_cores sees it running
+        self.events.wait_for(lambda: self.events.status(self.container.id) != "created", timeout=1)  # type: ignore
         self.logger.job_start(self.job, self.cpu_cores, self.nr_threads)
         self.is_paused = False
         return True
 
+    def status(self) -> str:
+        if self.events.ended:
+            # Without the events stream the cached status is stale, so we ask the daemon instead
+            self.container.reload()
+            return self.container.status.lower()  # type: ignore
+        return self.events.status(self.container.id)  # type: ignore
+
     def is_finished(self) -> bool:
-        self.container.reload()
-        is_finished = self.container.status.lower().startswith("exited")
+        is_finished = self.status().startswith("exited")
 
         if is_finished:
             self.logger.job_end(self.job)
@@ -56,8 +67,7 @@ class ControllerJob:
         return is_finished
 
     def is_running(self) -> bool:
-        self.container.reload()
-        is_running = self.container.status.lower().startswith("running")
+        is_running = self.status().startswith("running")
 
         return is_running
 
@@ -0,0 +1,90 @@
+"""
+Client for memcached's `stats` command that keeps one TCP connection open for the whole run, instead of forking a
+shell and `nc` for every sample.
+"""
+
+import socket
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class StatsSample:
+    # time.monotonic() halfway between sending the request and receiving the end of the response
+    timestamp: float
+    values: dict[str, int]
+
+
+@dataclass
+class StatsDelta:
+    interval: float
+    cmd_get: int
+    cmd_set: int
+
+    def per_interval(self, interval: float) -> float:
+        """Number of gets in `interval` seconds, at the rate measured over this delta."""
+        return self.cmd_get / self.interval * interval
+
+
+class MemcachedStats:
+    def __init__(
+        self, host: str, port: int = 11211, timeout: float = 0.5, fields: tuple[str, ...] = ("cmd_get", "cmd_set")
+    ):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.prefixes = {f"STAT {field} ".encode("utf-8"): field for field in fields}
+        self.sock: Optional[socket.socket] = None
+        self.previous: Optional[StatsSample] = None
+
+    def _connect(self) -> socket.socket:
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def close(self) -> None:
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _request(self) -> StatsSample:
+        if self.sock is None:
+            self.sock = self._connect()
+
+        sent = time.monotonic()
+        self.sock.sendall(b"stats\r\n")
+        response = b""
+        while not response.endswith(b"END\r\n"):
+            chunk = self.sock.recv(8192)
+            if not chunk:
+                raise ConnectionError("memcached closed the connection")
+            response += chunk
+        received = time.monotonic()
+
+        values = {}
+        for line in response.split(b"\r\n"):
+            for prefix, field in self.prefixes.items():
+                if line.startswith(prefix):
+                    values[field] = int(line[len(prefix) :])
+        return StatsSample((sent + received) / 2, values)
+
+    def sample(self) -> Optional[StatsSample]:
+        """Current values of the fields, or None if memcached could not be reached (even after reconnecting)."""
+        for _ in range(2):
+            try:
+                return self._request()
+            except (OSError, ValueError):
+                # Broken connection, the next attempt opens a new one
+                self.close()
+        return None
+
+    def delta(self, current: StatsSample) -> Optional[StatsDelta]:
+        """Change of cmd_get/cmd_set since the sample passed to the previous call, None on the first call."""
+        previous, self.previous = self.previous, current
+        if previous is None or current.timestamp <= previous.timestamp:
+            return None
+        return StatsDelta(
+            interval=current.timestamp - previous.timestamp,
+            cmd_get=current.values.get("cmd_get", 0) - previous.values.get("cmd_get", 0),
+            cmd_set=current.values.get("cmd_set", 0) - previous.values.get("cmd_set", 0),
+        )
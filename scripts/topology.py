@@ -0,0 +1,99 @@
+"""
+Cached snapshot of the cluster topology (nodes, pods, jobs and services).
+
+All four resource types are fetched over one keep-alive API connection and kept for `ttl` seconds, so that
+resolving several node names and IPs in a row does not spawn one `kubectl` per lookup. Our own create/delete calls invalidate
+the snapshot explicitly (see `utils.run_command`).
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from loguru import logger
+
+from scripts.backend import get_backend
+from scripts.kube_client import JobInfo, KubeAPIError, NodeInfo, PodInfo, ServiceInfo
+
+
+DEFAULT_TTL = float(os.environ.get("CCA_TOPOLOGY_TTL", "5"))
+
+
+@dataclass
+class Snapshot:
+    nodes: list[NodeInfo]
+    pods: list[PodInfo]
+    jobs: list[JobInfo]
+    services: list[ServiceInfo]
+    taken_at: float
+    # An empty snapshot standing in for a fetch that failed, it is never cached
+    failed: bool = False
+
+
+def fetch_snapshot() -> Snapshot:
+    backend = get_backend()
+    try:
+        return Snapshot(
+            nodes=backend.list_objects("nodes"),
+            pods=backend.list_objects("pods"),
+            jobs=backend.list_objects("jobs"),
+            services=backend.list_objects("services"),
+            taken_at=time.monotonic(),
+        )
+    except (KubeAPIError, OSError) as e:
+        logger.error(f"Could not fetch cluster topology: {e}")
+        return Snapshot([], [], [], [], taken_at=time.monotonic(), failed=True)
+
+
+class Topology:
+    def __init__(self, ttl: float = DEFAULT_TTL):
+        self.ttl = ttl
+        self._snapshot: Optional[Snapshot] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._snapshot = None
+
+    def refresh(self) -> Snapshot:
+        snapshot = fetch_snapshot()
+        with self._lock:
+            # After a failed fetch the next lookup tries again instead of reusing the empty snapshot for the whole TTL
+            self._snapshot = None if snapshot.failed else snapshot
+        return snapshot
+
+    def snapshot(self) -> Snapshot:
+        with self._lock:
+            snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot.taken_at > self.ttl:
+            snapshot = self.refresh()
+        return snapshot
+
+    def nodes(self) -> list[NodeInfo]:
+        return self.snapshot().nodes
+
+    def pods(self) -> list[PodInfo]:
+        return self.snapshot().pods
+
+    def jobs(self) -> list[JobInfo]:
+        return self.snapshot().jobs
+
+    def services(self) -> list[ServiceInfo]:
+        return self.snapshot().services
+
+    def node(self, prefix: str) -> Optional[NodeInfo]:
+        return next((node for node in self.nodes() if node.name.startswith(prefix)), None)
+
+    def pod(self, prefix: str) -> Optional[PodInfo]:
+        return next((pod for pod in self.pods() if pod.name.startswith(prefix)), None)
+
+    def job(self, prefix: str) -> Optional[JobInfo]:
+        return next((job for job in self.jobs() if job.name.startswith(prefix)), None)
+
+    def service(self, prefix: str) -> Optional[ServiceInfo]:
+        return next((service for service in self.services() if service.name.startswith(prefix)), None)
+
+
+TOPOLOGY = Topology()
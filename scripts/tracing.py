@@ -0,0 +1,155 @@
+"""
+Span-based tracing of an orchestration run.
+
+Commands, SSH calls, copies, readiness waits and sleeps are recorded as nested spans and exported as a Chrome trace
+(`trace.json`, open it in https://ui.perfetto.dev or chrome://tracing) next to the results of a run. Every thread and
+every asyncio task gets its own lane, so overlapping work shows up side by side. The summary at export time breaks
+the run down by category, i.e. how much of it was spent in kubectl, ssh, copies, waiting and sleeping.
+
+Set CCA_TRACE=0 to disable tracing.
+"""
+
+import asyncio
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+from loguru import logger
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = os.environ.get("CCA_TRACE", "1") != "0"
+        self.events: list[dict[str, Any]] = []
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        # Lane (thread or asyncio task) -> (tid, name)
+        self._lanes: dict[int, tuple[int, str]] = {}
+
+    def _now(self) -> float:
+        # Chrome traces use microseconds
+        return (time.perf_counter() - self._start) * 1e6
+
+    def _lane(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            key, name = id(task), task.get_name()
+        else:
+            key, name = threading.get_ident(), threading.current_thread().name
+
+        with self._lock:
+            if key not in self._lanes:
+                self._lanes[key] = (len(self._lanes) + 1, name)
+            return self._lanes[key][0]
+
+    @contextmanager
+    def span(self, name: str, category: str, **args) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+
+        tid = self._lane()
+        start = self._now()
+        try:
+            yield
+        finally:
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start,
+                "dur": self._now() - start,
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": args,
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def summary(self) -> dict[str, float]:
+        """
+        Seconds per category, only counting spans that are not nested in a span of the same category. Categories do
+        nest (every ssh span contains a command span), so the shares do not add up to 100%.
+        """
+        with self._lock:
+            events = sorted(self.events, key=lambda e: (e["tid"], e["ts"]))
+
+        totals: dict[str, float] = {}
+        open_until: dict[tuple[int, str], float] = {}
+        for event in events:
+            key = (event["tid"], event["cat"])
+            if event["ts"] < open_until.get(key, -1):
+                continue
+            open_until[key] = event["ts"] + event["dur"]
+            totals[event["cat"]] = totals.get(event["cat"], 0) + event["dur"] / 1e6
+        return totals
+
+    def export(self, path: str) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            lanes = [
+                {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                for tid, name in self._lanes.values()
+            ]
+            events = lanes + list(self.events)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+        run_time = self._now() / 1e6
+        lines = [f"{'category':<12} {'seconds':>9} {'share':>6}"]
+        for category, seconds in sorted(self.summary().items(), key=lambda item: -item[1]):
+            lines.append(f"{category:<12} {seconds:>9.1f} {100 * seconds / run_time:>5.1f}%")
+        logger.info(f"Wrote trace of {run_time:.0f}s to {path}:\n" + "\n".join(lines))
+
+
+TRACER = Tracer()
+
+
+def span(name: str, category: str, **args):
+    return TRACER.span(name, category, **args)
+
+
+def traced(category: str, describe: Optional[Callable[..., str]] = None) -> Callable:
+    """
+    Decorator that records every call as a span. `describe` receives the call's arguments and returns the span
+    name (default: the function name). Works for plain functions and coroutine functions.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        def name_of(*args, **kwargs) -> str:
+            return describe(*args, **kwargs) if describe is not None else func.__name__
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name_of(*args, **kwargs), category):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name_of(*args, **kwargs), category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def traced_sleep(seconds: float, reason: str = "sleep") -> None:
+    with span(reason, "sleep", seconds=seconds):
+        time.sleep(seconds)
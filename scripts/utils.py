@@ -1,11 +1,28 @@
+import atexit
+import functools
+import hashlib
+import io
+import json
 import os
 import subprocess
 import sys
-from typing import Optional
+import tarfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
 from enum import Enum
 
 from loguru import logger
 
+from scripts.backend import get_backend
+from scripts.ssh_pool import SSH_KEY_FILE, SSHSessionPool
+from scripts.kube_client import JobInfo, PodInfo, ServiceInfo
+from scripts.output_sink import OutputSink
+from scripts.topology import TOPOLOGY
+from scripts.tracing import span, traced
+
 
 #### SETUP ENVIRONMENT VARIABLES ########
 
@@ -17,19 +34,54 @@ env["PROJECT"] = PROJECT
 env["ZONE"] = "europe-west3-a"
 env["USER"] = "ubuntu"
 
+# kubernetes (the real cluster) or local (a simulated cluster on this machine, see local_cluster)
+BACKEND = get_backend()
+
 # if os is not windows
-if os.name != "nt":
+if os.name != "nt" and not BACKEND.simulated:
     assert (
         "cca-eth" in subprocess.run("gcloud config get-value project".split(), capture_output=True).stdout.decode()
     ), "You are not in the correct project. Run 'gcloud config set project cca-eth-2024-group-076-djueni'"
 
 #### END SETUP ENVIRONMENT VARIABLES ####
 
+SSH_POOL = SSHSessionPool(zone=env["ZONE"], user=env["USER"])
+
+
+@atexit.register
+def _close_ssh_pool() -> None:
+    if len(SSH_POOL.timings) > 0:
+        logger.info(f"SSH timing report:\n{SSH_POOL.timing_report()}")
+    SSH_POOL.close_all()
+
+
+# Verbose provisioning output (apt, install scripts) is streamed here instead of being buffered and printed
+PROVISIONING_LOGS = os.path.join(".", "logs", "provisioning")
+
+# kubectl subcommands that change the cluster and therefore invalidate the cached topology
+MUTATING_KUBECTL_COMMANDS = {"create", "delete", "apply", "expose", "label", "run", "scale", "patch"}
 
+# Cluster tools whose invocations a simulated backend handles itself
+CLUSTER_TOOLS = {"kubectl", "kops", "gsutil", "gcloud"}
+
+
+@traced("command", lambda command, *args, **kwargs: " ".join(command)[:100])
 def run_command(
-    command: list[str], env: dict[str, str] = env, log_success: bool = True
+    command: list[str],
+    env: dict[str, str] = env,
+    log_success: bool = True,
+    input: Optional[bytes] = None,
+    sink: Optional[OutputSink] = None,
 ) -> subprocess.CompletedProcess[bytes]:
-    res = subprocess.run(command, env=env, capture_output=True)
+    if BACKEND.simulated and command[0] in CLUSTER_TOOLS:
+        res = BACKEND.run(command, input)
+    elif sink is None:
+        res = subprocess.run(command, env=env, capture_output=True, input=input)
+    else:
+        res = _stream_command(command, env, input, sink)
+    if len(command) > 1 and command[0] == "kubectl" and command[1] in MUTATING_KUBECTL_COMMANDS:
+        TOPOLOGY.invalidate()
+
     if res.returncode != 0:
         logger.error(f"\nCommand: {' '.join(command)}")
         print(f"Output: {res.stderr.decode('utf-8')}")
@@ -43,27 +95,180 @@ def run_command(
     return res
 
 
-def ssh_command(
-    node: str, command: str, env: dict[str, str] = env, is_async: bool = False, file=subprocess.STDOUT
-) -> subprocess.CompletedProcess[bytes] | subprocess.Popen[bytes]:
-    ssh_command = [
+def _stream_command(
+    command: list[str], env: dict[str, str], input: Optional[bytes], sink: OutputSink
+) -> subprocess.CompletedProcess[bytes]:
+    # stdout and stderr go through the sink line by line, only its bounded tail is returned as stdout
+    process = subprocess.Popen(
+        command,
+        env=env,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    sink.attach(process.stdout)  # type: ignore
+    if input is not None:
+        process.stdin.write(input)  # type: ignore
+        process.stdin.close()  # type: ignore
+    process.wait()
+    sink.wait()
+    return subprocess.CompletedProcess(command, process.returncode, sink.tail_text().encode("utf-8"), b"")
+
+
+def build_ssh_command(node: str, command: str, env: dict[str, str] = env) -> tuple[list[str], str]:
+    """Returns the command line to run `command` on the node and the kind under which its latency is recorded."""
+    if BACKEND.simulated:
+        return BACKEND.node_argv(node, command), "local"
+
+    session = SSH_POOL.acquire(node)
+    if session is not None:
+        return session.ssh_argv(command), "ssh"
+
+    return [
         "gcloud",
         "compute",
         "ssh",
         "--zone",
         env.get("ZONE", "europe-west3-a"),
         "--ssh-key-file",
-        os.path.expanduser("~/.ssh/cloud-computing"),
+        SSH_KEY_FILE,
         f"{env.get('USER', 'ubuntu')}@{node}",
         "--command",
         command,
-    ]
+    ], "gcloud-ssh"
+
+
+def build_copy_command(node: str, source_path: str, destination_path: str, to_node: bool) -> tuple[list[str], str]:
+    if BACKEND.simulated:
+        return BACKEND.copy_argv(node, source_path, destination_path, to_node), "local-copy"
+
+    session = SSH_POOL.acquire(node)
+    if session is not None:
+        if to_node:
+            return session.scp_to_argv(source_path, destination_path), "scp"
+        return session.scp_from_argv(source_path, destination_path), "scp"
+
+    if to_node:
+        destination_path = f"ubuntu@{node}:{destination_path}"
+    else:
+        source_path = f"ubuntu@{node}:{source_path}"
+    return [
+        "gcloud",
+        "compute",
+        "scp",
+        "--ssh-key-file",
+        SSH_KEY_FILE,
+        "--zone",
+        "europe-west3-a",
+        source_path,
+        destination_path,
+    ], "gcloud-scp"
+
+
+@traced("ssh", lambda node, command, *args, **kwargs: f"{node}: {command}"[:100])
+def ssh_command(
+    node: str,
+    command: str,
+    env: dict[str, str] = env,
+    is_async: bool = False,
+    file=subprocess.STDOUT,
+    input: Optional[bytes] = None,
+) -> subprocess.CompletedProcess[bytes] | subprocess.Popen[bytes]:
+    ssh_command, kind = build_ssh_command(node, command, env)
     logger.info(f"\n({'Asynchronous' if is_async else 'Synchronous'}) SSH Command on node {node}: {command}")
 
+    sink = file if isinstance(file, OutputSink) else None
+
     if is_async:
-        return subprocess.Popen(ssh_command, env=env, stdout=file, stderr=subprocess.STDOUT)
-    else:
-        return run_command(ssh_command, env, log_success=False)
+        if sink is None:
+            return subprocess.Popen(ssh_command, env=env, stdout=file, stderr=subprocess.STDOUT)
+        process = subprocess.Popen(ssh_command, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        sink.attach(process.stdout)  # type: ignore
+        return process
+
+    start = time.monotonic()
+    res = run_command(ssh_command, env, log_success=False, input=input, sink=sink)
+    SSH_POOL.record(node, kind, time.monotonic() - start)
+    return res
+
+
+# Upper bound of nodes that are provisioned concurrently by fan_out
+MAX_FAN_OUT = 8
+
+
+@dataclass
+class NodeResult:
+    node: str
+    returncode: int
+    duration: float
+    output: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.returncode == 0
+
+
+class FanOutError(Exception):
+    def __init__(self, message: str, results: list[NodeResult]):
+        super().__init__(message)
+        self.results = results
+
+
+def _run_on_node(node: str, action: Callable[[str], Any]) -> NodeResult:
+    start = time.monotonic()
+    try:
+        output = action(node)
+    except Exception as e:
+        return NodeResult(node, returncode=-1, duration=time.monotonic() - start, error=e)
+
+    # Actions may return the result of their last ssh/run_command, whose return code we propagate
+    returncode = output.returncode if isinstance(output, subprocess.CompletedProcess) else 0
+    return NodeResult(node, returncode=returncode, duration=time.monotonic() - start, output=output)
+
+
+@traced("fan_out", lambda node_prefix, *args, **kwargs: f"fan_out {node_prefix}")
+def fan_out(
+    node_prefix: str | tuple[str, ...],
+    action: Callable[[str], Any],
+    max_workers: int = MAX_FAN_OUT,
+    fail_fast: bool = False,
+) -> list[NodeResult]:
+    """
+    Runs `action(node_name)` concurrently on every node whose name starts with `node_prefix` and returns one
+    NodeResult per node. With `fail_fast`, the first failing node cancels all nodes that have not started yet and a
+    FanOutError is raised.
+    """
+    nodes = [line[0] for line in get_node_info() if line[0].startswith(node_prefix)]
+    if len(nodes) == 0:
+        logger.warning(f"No nodes found matching {node_prefix}")
+        return []
+
+    results: list[NodeResult] = []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(nodes))) as executor:
+        pending = {executor.submit(_run_on_node, node, action) for node in nodes}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            results.extend(future.result() for future in done)
+
+            failed = [result for result in results if not result.ok]
+            if fail_fast and len(failed) > 0:
+                for future in pending:
+                    future.cancel()
+                raise FanOutError(
+                    f"Failed on node {failed[0].node}: {failed[0].error or failed[0].returncode}", results
+                )
+
+    for result in sorted(results, key=lambda r: r.node):
+        if result.ok:
+            logger.info(f"{result.node}: finished in {result.duration:.2f}s")
+        else:
+            logger.error(f"{result.node}: failed after {result.duration:.2f}s ({result.error or result.returncode})")
+    return results
+
+
+def ssh_fan_out(node_prefix: str | tuple[str, ...], command: str, **kwargs) -> list[NodeResult]:
+    return fan_out(node_prefix, lambda node: ssh_command(node, command), **kwargs)
 
 
 class Part(Enum):
@@ -82,20 +287,115 @@ class Part(Enum):
         return f"{self.value}.k8s.local"
 
 
-def start_cluster(part: Part) -> None:
+# One JSON line per cluster start with the duration of each phase
+CLUSTER_START_LOG = os.path.join(".", "logs", "cluster_start.jsonl")
+
+
+class ClusterStart:
+    """
+    Handle of a cluster whose bring-up was started by `start_cluster`. The cluster is validated in the background, so
+    callers can run independent preparation (rendering manifests, building artifacts, ...) alongside it with
+    `run_alongside` and then block in `wait`.
+    """
+
+    def __init__(self, part: Part):
+        self.part = part
+        self.started_at = time.monotonic()
+        # Duration in seconds of each phase, in the order they finished
+        self.phases: dict[str, float] = {}
+
+        self._executor = ThreadPoolExecutor(max_workers=MAX_FAN_OUT, thread_name_prefix=f"start-{part.value}")
+        self._validation: Optional[Future] = None
+        self._preparations: list[tuple[str, Future]] = []
+        self._lock = threading.Lock()
+
+    def _record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[name] = seconds
+        logger.info(f"Cluster start phase '{name}' took {seconds:.1f}s")
+
+    def run_phase(self, name: str, command: list[str]) -> subprocess.CompletedProcess[bytes]:
+        start = time.monotonic()
+        with span(name, "cluster"):
+            res = run_command(command, env)
+        self._record(name, time.monotonic() - start)
+        return res
+
+    def validate_in_background(self) -> None:
+        logger.info("Waiting for cluster to be ready... (~10min)")
+        validate_command = ["kops", "validate", "cluster", "--wait", "10m"]
+        self._validation = self._executor.submit(self.run_phase, "validate", validate_command)
+
+    def run_alongside(self, name: str, action: Callable[[], Any]) -> Future:
+        """Runs `action()` while the cluster is being validated. Its duration is recorded as phase `prepare:<name>`."""
+
+        def timed():
+            start = time.monotonic()
+            try:
+                return action()
+            finally:
+                self._record(f"prepare:{name}", time.monotonic() - start)
+
+        future = self._executor.submit(timed)
+        self._preparations.append((name, future))
+        return future
+
+    def wait(self) -> bool:
+        """
+        Blocks until the cluster is validated and every preparation has finished (re-raising the first preparation
+        that failed). Returns whether the validation succeeded.
+        """
+        ready = True
+        if self._validation is not None:
+            ready = self._validation.result().returncode == 0
+        for _, future in self._preparations:
+            future.result()
+        self._executor.shutdown()
+
+        self._record("total", time.monotonic() - self.started_at)
+        logger.info(f"Cluster start of {self.part.value}:\n{self.phase_report()}")
+        self._save()
+
+        if not ready:
+            logger.error("Cluster validation failed")
+            return False
+
+        logger.success("Cluster is ready.")
+        view_command = ["kubectl", "get", "nodes", "-o", "wide"]
+        run_command(view_command, env)
+        logger.info(
+            "In order to ssh into one of the nodes, use:\n'gcloud compute ssh --ssh-key-file ~/.ssh/cloud-computing ubuntu@<MACHINE_NAME> --zone europe-west3-a'"
+        )
+        logger.success(f"########### Started cluster for {self.part} ###########")
+        return True
+
+    def phase_report(self) -> str:
+        lines = [f"{'phase':<40} {'seconds':>8}"]
+        with self._lock:
+            phases = list(self.phases.items())
+        for name, seconds in phases:
+            lines.append(f"{name:<40} {seconds:>8.1f}")
+        return "\n".join(lines)
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(CLUSTER_START_LOG), exist_ok=True)
+        entry = {"part": self.part.value, "date": time.strftime("%Y-%m-%d-%H-%M"), "phases": self.phases}
+        with open(CLUSTER_START_LOG, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def start_cluster(part: Part, wait_until_ready: bool = True) -> ClusterStart:
     """
-    Start a kubernetes cluster using kops
+    Start a kubernetes cluster using kops. With `wait_until_ready=False`, the returned handle is still validating the
+    cluster and the caller must call `wait()` on it (e.g. after submitting preparation work with `run_alongside`).
     """
     logger.info(f"########### Starting cluster for {part} ###########")
 
-    yaml_file = part.yaml_file
+    cluster = ClusterStart(part)
     cluster_name = part.cluster_name
 
-    create_bucket_command = ["gsutil", "mb", KOPS_STATE_STORE]
-    run_command(create_bucket_command, env)
-
-    create_command = ["kops", "create", "-f", yaml_file]
-    run_command(create_command, env)
+    cluster.run_phase("create bucket", ["gsutil", "mb", KOPS_STATE_STORE])
+    cluster.run_phase("create cluster", ["kops", "create", "-f", part.yaml_file])
 
     create_secret_command = [
         "kops",
@@ -108,58 +408,105 @@ def start_cluster(part: Part) -> None:
         "-i",
         os.path.expanduser("~/.ssh/cloud-computing.pub"),
     ]
-    run_command(create_secret_command, env)
+    cluster.run_phase("create secret", create_secret_command)
 
     update_command = ["kops", "update", "cluster", "--name", cluster_name, "--yes", "--admin"]
-    run_command(update_command, env)
+    cluster.run_phase("update cluster", update_command)
 
-    logger.info("Waiting for cluster to be ready... (~10min)")
-    validate_command = ["kops", "validate", "cluster", "--wait", "10m"]
-    run_command(validate_command, env)
+    cluster.validate_in_background()
+    if wait_until_ready:
+        cluster.wait()
+    return cluster
+
+
+# Output of `kops delete cluster`, one file per cluster
+TEARDOWN_LOGS = os.path.join(".", "logs", "teardown")
+
+
+def list_clusters() -> list[str]:
+    """Names of the clusters that exist in the kops state store."""
+    res = run_command(["kops", "get", "clusters", "-o", "json"], env, log_success=False)
+    if res.returncode != 0:
+        return []
+    clusters = json.loads(res.stdout.decode("utf-8"))
+    # kops prints a single object instead of a list if there is exactly one cluster
+    if isinstance(clusters, dict):
+        clusters = [clusters]
+    return [cluster["metadata"]["name"] for cluster in clusters]
 
-    logger.success("Cluster is ready.")
-    view_command = ["kubectl", "get", "nodes", "-o", "wide"]
-    run_command(view_command, env)
-    logger.info(
-        "In order to ssh into one of the nodes, use:\n'gcloud compute ssh --ssh-key-file ~/.ssh/cloud-computing ubuntu@<MACHINE_NAME> --zone europe-west3-a'"
-    )
-    logger.success(f"########### Started cluster for {part} ###########")
+
+def delete_state_store() -> None:
+    delete_bucket_command = ["gsutil", "rm", "-r", KOPS_STATE_STORE]
+    run_command(delete_bucket_command, env)
 
 
-def delete_cluster(cluster_name: str) -> None:
-    # We create a copy of the current environment variables to make sure we don't modify the original
-    environment_dict = dict(os.environ)
+def delete_cluster(cluster_name: str, delete_bucket: bool = True) -> None:
+    log_file = os.path.join(TEARDOWN_LOGS, f"{cluster_name}.txt")
 
-    # Update the environment variables
-    environment_dict["KOPS_STATE_STORE"] = KOPS_STATE_STORE
-    environment_dict["PROJECT"] = PROJECT
+    def log_progress(line: str) -> bool:
+        logger.info(f"[{cluster_name}] {line}")
+        return True
 
+    # kops waits for the cloud resources to drain, we report its progress as it happens
     delete_comand = ["kops", "delete", "cluster", cluster_name, "--yes"]
-    res = run_command(delete_comand, environment_dict)
-    if res.returncode != 0:
+    if BACKEND.simulated:
+        BACKEND.run(delete_comand)
+        return
+
+    with OutputSink(log_file) as sink:
+        process = subprocess.Popen(delete_comand, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        sink.attach(process.stdout, line_filter=log_progress)  # type: ignore
+        process.wait()
+    if process.returncode != 0:
         raise Exception(f"Cluster not found: {cluster_name}!")
-    delete_bucket_command = ["gsutil", "rm", "-r", KOPS_STATE_STORE]
-    run_command(delete_bucket_command, environment_dict)
 
-    logger.success("########### Cluster deleted ###########")
+    if delete_bucket:
+        delete_state_store()
 
+    logger.success(f"########### Cluster {cluster_name} deleted ###########")
 
-def get_info(resource_type: str) -> list[list[str]]:
-    get_command = ["kubectl", "get", resource_type, "-o", "wide"]
-    res = subprocess.run(get_command, env=dict(os.environ), capture_output=True)
 
-    # Split the output into lines and remove the first line (header)
-    lines = res.stdout.decode("utf-8").split("\n")[1:]
+def delete_clusters(cluster_names: Optional[list[str]] = None) -> dict[str, Optional[Exception]]:
+    """
+    Deletes the given clusters (default: every cluster in the state store) concurrently and removes the state store
+    once all of them are gone. Returns the error per cluster (None if it was deleted).
+    """
+    if cluster_names is None:
+        cluster_names = list_clusters()
+    if len(cluster_names) == 0:
+        logger.info("No clusters to delete")
+        return {}
+
+    logger.info(f"Deleting clusters {', '.join(cluster_names)}")
+    start = time.monotonic()
+    errors: dict[str, Optional[Exception]] = {}
+    with ThreadPoolExecutor(max_workers=len(cluster_names)) as executor:
+        futures = {executor.submit(delete_cluster, name, False): name for name in cluster_names}
+        for future in futures:
+            name = futures[future]
+            errors[name] = future.exception()
+            if errors[name] is not None:
+                logger.error(f"Error deleting cluster {name}: {errors[name]}")
+
+    # The state store is shared by all clusters, so it can only go once none of them is left
+    if all(error is None for error in errors.values()):
+        delete_state_store()
+    else:
+        logger.warning("Keeping the kops state store since not every cluster could be deleted")
+
+    deleted = sum(error is None for error in errors.values())
+    logger.info(f"Deleted {deleted}/{len(errors)} clusters in {time.monotonic() - start:.0f}s")
+    return errors
 
-    # Split each line into a list of strings and remove empty lines and empty strings
-    info = [line.split(" ") for line in lines if line != ""]
-    info = [[s for s in line if s != ""] for line in info]
-    return info
+
+def get_info(resource_type: str) -> list[list[str]]:
+    # Rows with the same columns as `kubectl get <resource_type> -o wide`, but read from the API server directly
+    return [item.row() for item in BACKEND.list_objects(resource_type)]
 
 
 def get_node_info(d: Optional[dict] = None) -> list[list[str]]:
     # Return: [ [node_name, status, roles, age, version, internal_ip, external_ip], ... ]
-    info = get_info("nodes")
+    info = [node.row() for node in TOPOLOGY.nodes()]
 
     if d is None:
         d = {}
@@ -179,96 +526,265 @@ def get_node_info(d: Optional[dict] = None) -> list[list[str]]:
 
 def get_pods_info() -> list[list[str]]:
     # Return: [ [name, ready, status, restarts, age, ip, node], ... ]
-    return get_info("pods")
+    return [pod.row() for pod in TOPOLOGY.pods()]
 
 
 def get_jobs_info() -> list[list[str]]:
     # Return: [ [name, completions, age], ... ]
-    return get_info("jobs")
+    return [job.row() for job in TOPOLOGY.jobs()]
 
 
-def pods_ready() -> bool:
-    info = get_pods_info()
-    if len(info) == 0:
+def _pods_ready(pods: list[PodInfo]) -> bool:
+    if len(pods) == 0:
         return False
-    for pod in info:
-        logger.info(pod)
-        if pod[1] != "1/1" or pod[2] != "Running":
-            return False
-    return True
+    return all(pod.ready == "1/1" and pod.status == "Running" for pod in pods)
 
 
-def services_ready() -> bool:
-    info = get_info("services")
-    if len(info) == 0:
+def _services_ready(services: list[ServiceInfo]) -> bool:
+    if len(services) == 0:
         return False
-    for service in info:
-        logger.info(service)
-        if service[3] == "<pending>":
-            return False
-    return True
+    return all(service.external_ip != "<pending>" for service in services)
 
 
-def pods_completed(job_name=None) -> bool:
-    info = get_pods_info()
-    if len(info) == 0:
+def _pods_completed(pods: list[PodInfo], job_name: Optional[str] = None) -> bool:
+    if len(pods) == 0:
         return False
     if job_name is not None:
-        info = [pod for pod in info if job_name in pod[0]]
-    for pod in info:
-        if "memcached" in pod[0]:
+        pods = [pod for pod in pods if job_name in pod.name]
+        if len(pods) == 0:
+            # The job's pod has not been created yet
+            return False
+    for pod in pods:
+        if "memcached" in pod.name:
             continue
-        if pod[2] != "Completed" and pod[2] != "Error":
+        if pod.status != "Completed" and pod.status != "Error":
             return False
     return True
 
 
+def _jobs_ready(jobs: list[JobInfo]) -> bool:
+    if len(jobs) == 0:
+        return False
+    return all(job.succeeded == job.completions for job in jobs)
+
+
+@traced("wait")
+def pods_ready() -> bool:
+    # One-off checks always ask the API server instead of the cached topology
+    pods = BACKEND.list_objects("pods")
+    for pod in pods:
+        logger.info(pod.row())
+    return _pods_ready(pods)
+
+
+@traced("wait")
+def services_ready() -> bool:
+    services = BACKEND.list_objects("services")
+    for service in services:
+        logger.info(service.row())
+    return _services_ready(services)
+
+
+@traced("wait")
+def pods_completed(job_name=None) -> bool:
+    return _pods_completed(BACKEND.list_objects("pods"), job_name)
+
+
+@traced("wait")
 def jobs_ready() -> bool:
-    info = get_jobs_info()
+    return _jobs_ready(BACKEND.list_objects("jobs"))
 
-    if len(info) == 0:
-        return False
 
-    for line in info:
-        if line[1] != "1/1":
-            return False
-    return True
+@traced("wait")
+def wait_for_pods_ready(timeout: Optional[float] = None) -> bool:
+    ready = BACKEND.wait_for("pods", _pods_ready, timeout=timeout)
+    for pod in BACKEND.items("pods"):
+        logger.info(pod.row())
+    return ready
 
 
+@traced("wait")
+def wait_for_services_ready(timeout: Optional[float] = None) -> bool:
+    ready = BACKEND.wait_for("services", _services_ready, timeout=timeout)
+    for service in BACKEND.items("services"):
+        logger.info(service.row())
+    return ready
+
+
+@traced("wait")
+def wait_for_pods_completed(job_name: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+    return BACKEND.wait_for("pods", lambda pods: _pods_completed(pods, job_name), timeout=timeout)
+
+
+@traced("wait")
+def wait_for_pods_deleted(name_prefix: str, timeout: Optional[float] = None) -> bool:
+    return BACKEND.wait_for(
+        "pods", lambda pods: not any(pod.name.startswith(name_prefix) for pod in pods), timeout=timeout
+    )
+
+
+@traced("wait")
+def wait_for_jobs_ready(timeout: Optional[float] = None) -> bool:
+    return BACKEND.wait_for("jobs", _jobs_ready, timeout=timeout)
+
+
+@traced("copy", lambda node, source_path, *args, **kwargs: f"{source_path} -> {node}")
 def copy_file_to_node(node: str, source_path: str, destination_path: str) -> None:
 
     print(f"Copying file {source_path} to node {node}")
 
-    copy_command = [
-        "gcloud",
-        "compute",
-        "scp",
-        "--ssh-key-file",
-        os.path.expanduser("~/.ssh/cloud-computing"),
-        "--zone",
-        "europe-west3-a",
-        source_path,
-        f"ubuntu@{node}:{destination_path}",
-    ]
+    copy_command, kind = build_copy_command(node, source_path, destination_path, to_node=True)
+
+    start = time.monotonic()
     run_command(copy_command, dict(os.environ))
+    SSH_POOL.record(node, kind, time.monotonic() - start)
 
 
+@traced("copy", lambda node, source_path, *args, **kwargs: f"{node}:{source_path}")
 def copy_file_from_node(node: str, source_path: str, destination_path: str) -> None:
 
     print(f"Copying file {source_path} to node {node}")
 
-    copy_command = [
-        "gcloud",
-        "compute",
-        "scp",
-        "--ssh-key-file",
-        os.path.expanduser("~/.ssh/cloud-computing"),
-        "--zone",
-        "europe-west3-a",
-        f"ubuntu@{node}:{source_path}",
-        destination_path,
-    ]
+    copy_command, kind = build_copy_command(node, source_path, destination_path, to_node=False)
+
+    start = time.monotonic()
     run_command(copy_command, dict(os.environ))
+    SSH_POOL.record(node, kind, time.monotonic() - start)
+
+
+@dataclass
+class SyncReport:
+    node: str
+    files_sent: int
+    files_skipped: int
+    bytes_sent: int
+    bytes_skipped: int
+    duration: float
+
+
+class SyncError(Exception):
+    pass
+
+
+def _sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+@traced("copy", lambda node, files: f"sync {len(files)} files -> {node}")
+def sync_files_to_node(node: str, files: list[tuple[str, str]]) -> SyncReport:
+    """
+    Copies (local_path, remote_path) pairs to the node, where remote paths are relative to the home directory.
+    Files whose sha256 already matches on the node are skipped, the others are sent as a single tar stream, so the
+    whole sync costs two SSH round-trips regardless of the number of files. Raises SyncError if the files could not be
+    extracted on the node (e.g. a root-owned directory left by an earlier sudo build).
+    """
+    start = time.monotonic()
+    local_hashes = {remote_path: _sha256(local_path) for local_path, remote_path in files}
+
+    hash_command = f"cd ~ && sha256sum {' '.join(remote_path for _, remote_path in files)} 2>/dev/null; true"
+    res = ssh_command(node, hash_command)
+    remote_hashes = {}
+    for line in res.stdout.decode("utf-8").splitlines():  # type: ignore
+        parts = line.split()
+        if len(parts) == 2:
+            remote_hashes[parts[1]] = parts[0]
+
+    changed = [(local, remote) for local, remote in files if remote_hashes.get(remote) != local_hashes[remote]]
+    skipped = [(local, remote) for local, remote in files if remote_hashes.get(remote) == local_hashes[remote]]
+
+    if len(changed) > 0:
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+            for local_path, remote_path in changed:
+                tar.add(local_path, arcname=remote_path)
+        res = ssh_command(node, "tar -xzf - -C ~", input=archive.getvalue())
+        if res.returncode != 0:
+            output = b"".join(out for out in (res.stdout, res.stderr) if out).decode("utf-8").strip()  # type: ignore
+            raise SyncError(f"Could not extract {len(changed)} files on {node}: {output}")
+
+    report = SyncReport(
+        node=node,
+        files_sent=len(changed),
+        files_skipped=len(skipped),
+        bytes_sent=sum(os.path.getsize(local) for local, _ in changed),
+        bytes_skipped=sum(os.path.getsize(local) for local, _ in skipped),
+        duration=time.monotonic() - start,
+    )
+
+    # Compare against what one scp per file has cost so far in this run (if we have copied anything before)
+    copy_timings = [t for (_, kind), values in SSH_POOL.timings.items() if kind.endswith("scp") for t in values]
+    saved = ""
+    if len(copy_timings) > 0:
+        estimated = len(files) * sum(copy_timings) / len(copy_timings)
+        saved = f", ~{estimated - report.duration:.1f}s saved compared to one scp per file"
+
+    logger.info(
+        f"Synced {report.files_sent} files ({report.bytes_sent} bytes) to {node}, skipped {report.files_skipped} "
+        f"unchanged files ({report.bytes_skipped} bytes) in {report.duration:.2f}s{saved}"
+    )
+    return report
+
+
+# Fingerprints of the provisioning steps applied to a node are kept on the node itself
+PROVISIONING_STATE_DIR = "~/.cca-provisioning"
+
+
+def fingerprint(*parts: str | bytes) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8") if isinstance(part, str) else part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def file_fingerprint(*paths: str) -> str:
+    contents = []
+    for path in paths:
+        with open(path, "rb") as f:
+            contents.append(f.read())
+    return fingerprint(*contents)
+
+
+class Provisioner:
+    """
+    Applies named provisioning steps to a node at most once per fingerprint (e.g. the hash of an install script, a
+    package set or a rendered config). All fingerprints of a node are read with a single ssh call.
+    """
+
+    def __init__(self, node: str):
+        self.node = node
+        self._applied: Optional[dict[str, str]] = None
+
+    @property
+    def applied(self) -> dict[str, str]:
+        if self._applied is None:
+            read_command = (
+                f"mkdir -p {PROVISIONING_STATE_DIR} && cd {PROVISIONING_STATE_DIR} && grep -H . * 2>/dev/null; true"
+            )
+            res = ssh_command(self.node, read_command)
+            # Output: <step>:<fingerprint>
+            lines = res.stdout.decode("utf-8").splitlines()  # type: ignore
+            self._applied = dict(line.split(":", 1) for line in lines if ":" in line)
+        return self._applied
+
+    def step(self, name: str, fingerprint: str, apply: Callable[[], Any]) -> bool:
+        """
+        Runs `apply()` unless the step was already applied with the same fingerprint. A step whose `apply` returns a
+        failed CompletedProcess or raises is not recorded. Returns whether the step was applied.
+        """
+        if self.applied.get(name) == fingerprint:
+            logger.info(f"{self.node}: '{name}' is up to date, skipping")
+            return False
+
+        res = apply()
+        if isinstance(res, subprocess.CompletedProcess) and res.returncode != 0:
+            logger.error(f"{self.node}: '{name}' failed, not recording it")
+            return True
+
+        ssh_command(self.node, f"echo {fingerprint} > {PROVISIONING_STATE_DIR}/{name}")
+        self.applied[name] = fingerprint
+        return True
 
 
 def check_output(res: subprocess.CompletedProcess) -> None:
@@ -289,57 +805,134 @@ def log_pods() -> None:
 
 
 def get_node_ip(node_name: str) -> Optional[str]:
-    info = get_node_info()
-    for line in info:
-        if line[0].startswith(node_name):
-            return line[5]
-    return None
+    node = TOPOLOGY.node(node_name)
+    return node.internal_ip if node is not None else None
+
+
+def get_node_name(node_prefix: str) -> Optional[str]:
+    node = TOPOLOGY.node(node_prefix)
+    return node.name if node is not None else None
 
 
 def get_pod_ip(pod_name: str) -> Optional[str]:
-    info = get_pods_info()
-    for line in info:
-        if pod_name in line[0]:
-            return line[5]
+    for pod in TOPOLOGY.pods():
+        if pod_name in pod.name:
+            return pod.ip
 
     return None
 
 
+MCPERF_NODES = ("client-agent", "client-measure")
+MCPERF_REPOSITORY = "https://github.com/eth-easl/memcache-perf-dynamic.git"
+MCPERF_INSTALL_SCRIPT = "./scripts/install_mcperf_dynamic.sh"
+MCPERF_REMOTE_PATH = "memcache-perf-dynamic/mcperf"
+# Shared libraries the prebuilt binary links against (instead of the full build dependencies)
+MCPERF_RUNTIME_PACKAGES = "libevent-dev libzmq3-dev"
+
+# Prebuilt binaries, named after the OS image they were built on and the source revision
+ARTIFACT_CACHE = os.path.join(".", ".cache", "artifacts")
+
+
 def install_mcperf(check_memcached: bool = True) -> None:
     # memcached should already be ready since we wait for it in install_memcached
     if check_memcached:
         assert is_memcached_ready(), "Memcached pod not ready"
 
-    source_path = "./scripts/install_mcperf_dynamic.sh"
-    destination_path = "~/install_mcperf_dynamic.sh"
-    mcperf_dynamic_path = "~/memcache-perf-dynamic/mcperf"
+    nodes = [line[0] for line in get_node_info() if line[0].startswith(MCPERF_NODES)]
+    if len(nodes) == 0:
+        logger.warning(f"No nodes found matching {MCPERF_NODES}")
+        return
 
-    for line in get_node_info():
-        if line[0].startswith("client-agent") or line[0].startswith("client-measure"):
+    # All client nodes are created from the same image, so one of them builds the binary for all others
+    artifact = _mcperf_artifact(nodes[0])
 
-            # First we check if we have already copied the file to the node, if so, we do not do it again
-            check_command = f"test -f {mcperf_dynamic_path} && echo 'already installed' || echo '-'"
-            res = ssh_command(
-                line[0],
-                check_command,
-                is_async=False,
-            )
+    def install_on_node(node: str) -> bool:
+        provisioner = Provisioner(node)
+        if artifact is None:
+            install_fingerprint = file_fingerprint(MCPERF_INSTALL_SCRIPT)
+            return provisioner.step("mcperf", install_fingerprint, lambda: _install_mcperf_on_node(node))
+        return provisioner.step("mcperf", file_fingerprint(artifact), lambda: _push_mcperf(node, artifact))
 
-            if "already installed" in res.stdout.decode("utf-8"):  # type: ignore
-                logger.info(f"Mcperf already installed on {line[0]}")
-                continue
+    fan_out(MCPERF_NODES, install_on_node)
 
-            copy_file_to_node(line[0], source_path=source_path, destination_path=destination_path)
-            logger.info(f"Copied the mcperf install script to {line[0]}")
+    logger.success("########### Finished Installing mcperf on all mcperf machines ###########")
 
-            install_command = f"sudo chmod +x {destination_path} && sudo {destination_path}"
-            ssh_command(
-                line[0],
-                install_command,
-                is_async=False,
-            )
 
-    logger.success("########### Finished Installing mcperf on all mcperf machines ###########")
+# Resolved once per run, so that it can be looked up while the cluster is still starting (see ClusterStart.run_alongside)
+@functools.lru_cache(maxsize=None)
+def mcperf_source_revision() -> Optional[str]:
+    res = run_command(["git", "ls-remote", MCPERF_REPOSITORY, "HEAD"], dict(os.environ), log_success=False)
+    # Output: <commit hash>\tHEAD
+    if res.returncode != 0 or res.stdout.strip() == b"":
+        return None
+    return res.stdout.decode("utf-8").split()[0]
+
+
+def _os_image(node: str) -> str:
+    res = ssh_command(node, '. /etc/os-release && echo "$ID-$VERSION_ID-$(uname -m)"')
+    return res.stdout.decode("utf-8").strip()  # type: ignore
+
+
+def _mcperf_artifact(build_node: str) -> Optional[str]:
+    """
+    Returns the cached mcperf binary for the client image and the current source revision, building it on
+    `build_node` (and caching it) if there is none yet. Returns None if no binary could be obtained.
+    """
+    revision = mcperf_source_revision()
+    if revision is None:
+        logger.warning(f"Could not resolve the revision of {MCPERF_REPOSITORY}, building mcperf on every node")
+        return None
+
+    artifact = os.path.join(ARTIFACT_CACHE, f"mcperf-{_os_image(build_node)}-{revision[:12]}")
+    if os.path.exists(artifact):
+        logger.info(f"Using prebuilt {artifact}")
+        return artifact
+
+    logger.info(f"No prebuilt mcperf at {artifact}, building it on {build_node}")
+    res = _install_mcperf_on_node(build_node, revision)
+    if res.returncode != 0:
+        logger.warning(f"Building mcperf on {build_node} failed, building it on every node")
+        return None
+
+    os.makedirs(ARTIFACT_CACHE, exist_ok=True)
+    download_path = f"{artifact}.download"
+    copy_file_from_node(build_node, f"~/{MCPERF_REMOTE_PATH}", download_path)
+    if not os.path.exists(download_path):
+        return None
+    os.chmod(download_path, 0o755)
+    os.replace(download_path, artifact)
+    return artifact
+
+
+def _push_mcperf(node: str, artifact: str) -> subprocess.CompletedProcess[bytes]:
+    with OutputSink(os.path.join(PROVISIONING_LOGS, f"{node}-install_mcperf.txt")) as sink:
+        ssh_command(node, f"sudo apt-get update && sudo apt-get install {MCPERF_RUNTIME_PACKAGES} --yes", file=sink)
+    sync_files_to_node(node, [(artifact, MCPERF_REMOTE_PATH)])
+
+    res = ssh_command(node, f"ldd ~/{MCPERF_REMOTE_PATH} | grep 'not found'; true")
+    missing = res.stdout.decode("utf-8").strip()  # type: ignore
+    if missing != "":
+        logger.warning(f"Prebuilt mcperf cannot run on {node} ({missing}), building it there")
+        return _install_mcperf_on_node(node)
+
+    logger.info(f"Installed prebuilt mcperf on {node}")
+    return res
+
+
+def _install_mcperf_on_node(node: str, revision: Optional[str] = None) -> subprocess.CompletedProcess[bytes]:
+    destination_path = "~/install_mcperf_dynamic.sh"
+
+    sync_files_to_node(node, [(MCPERF_INSTALL_SCRIPT, "install_mcperf_dynamic.sh")])
+    logger.info(f"Copied the mcperf install script to {node}")
+
+    install_command = f"sudo chmod +x {destination_path} && sudo {destination_path} {revision or ''}"
+    with OutputSink(os.path.join(PROVISIONING_LOGS, f"{node}-install_mcperf.txt")) as sink:
+        return ssh_command(
+            node,
+            install_command,
+            is_async=False,
+            file=sink,
+        )  # type: ignore
 
 
 def is_memcached_ready() -> bool: